@@ -33,7 +33,7 @@ DEBUG = True
 ALLOWED_HOSTS = []
 
 AUTH_USER_MODEL = 'artist.CustomUser'
-from decouple import config
+from decouple import Csv, config
 
 CLIENT_ID = config('CLIENT_ID')
 CLIENT_SECRET = config('CLIENT_SECRET')
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'artist',
     'ecommerce',
+    'core',
     'rest_framework',
     'oauth2_provider',
     'corsheaders',
@@ -62,13 +63,82 @@ OAUTH2_PROVIDER = {
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'core.authentication.CachedOAuth2Authentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
 
+# Following timeline fan-out and size limits; see artist.timeline.
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_BACKFILL_SIZE = 100
+TIMELINE_MAX_ENTRIES = 800
+
+# Background jobs; see core.jobs.
+JOB_QUEUE_EAGER = config('JOB_QUEUE_EAGER', default=False, cast=bool)
+JOB_QUEUE_VISIBILITY_TIMEOUT = 300
+JOB_QUEUE_RETRY_DELAY = 10
+
+# UserActivity write buffering; see artist.activity.ActivityRecorder.
+ACTIVITY_BUFFERING = config('ACTIVITY_BUFFERING', default=True, cast=bool)
+ACTIVITY_BUFFER_SIZE = 100
+ACTIVITY_BUFFER_LIMIT = 10000
+ACTIVITY_FLUSH_INTERVAL = 2.0
+
+# UserActivity retention; see `manage.py archive_activity`.
+ACTIVITY_RETENTION_DAYS = 90
+ACTIVITY_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Live updates (api/events/); use core.events.DatabaseBroker with several workers.
+EVENTS_BROKER = config('EVENTS_BROKER', default='core.events.LocalBroker')
+EVENTS_POLL_INTERVAL = 0.5
+EVENTS_RETENTION_SECONDS = 60
+
+# Validated access token cache; see core.authentication.TokenCache.
+OAUTH2_TOKEN_CACHE_TTL = 60
+OAUTH2_TOKEN_CACHE_SIZE = 10000
+OAUTH2_TOKEN_CACHE_ALIAS = config('OAUTH2_TOKEN_CACHE_ALIAS', default=None)
+
+# Idempotency-Key replay window and pending lease; see core.idempotency.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_KEY_LEASE = 60
+
+# Per-request timings; see core.middleware.RequestInstrumentationMiddleware.
+REQUEST_INSTRUMENTATION = config('REQUEST_INSTRUMENTATION', default=False, cast=bool)
+REQUEST_INSTRUMENTATION_DUPLICATE_THRESHOLD = 5
+
+# Maximum queries per request by URL name, checked while instrumentation is on.
+QUERY_BUDGETS = {
+    'post-list-create': 3,
+    'user-posts': 4,
+    'following-feed': 4,
+    'user-profile': 2,
+    'user-activity': 2,
+    'user-activity-detail': 3,
+    'user-followers': 3,
+    'user-following': 3,
+    'notification-list': 2,
+}
+QUERY_BUDGETS_ENFORCED = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Prometheus metrics served at /metrics/; see core.metrics and core.views.metrics.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default=None)
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_TOKEN = config('METRICS_TOKEN', default=None)
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -93,6 +163,7 @@ CORS_ALLOW_HEADERS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -101,7 +172,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'oauth2_provider.middleware.OAuth2TokenMiddleware',
+    'core.middleware.OAuth2TokenMiddleware',
+    'core.middleware.ReadReplicaMiddleware',
+    'core.middleware.RequestInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'artbackend.urls'
@@ -135,6 +208,29 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma-separated SQLite copies of the primary; see core.routers.
+for index, replica in enumerate(config('DATABASE_REPLICAS', default='', cast=Csv())):
+    DATABASES[f'replica{index + 1}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # Opened read-only, so a missing file fails instead of being created.
+        'NAME': f'file:{replica}?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_RETRY_SECONDS = 30
+
+# Read-your-writes pinning; see core.middleware.ReadReplicaMiddleware.
+READ_YOUR_WRITES_SECONDS = 5
+READ_YOUR_WRITES_CACHE = 'default'
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -176,3 +272,5 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+TEST_RUNNER = 'core.testing.TestRunner'
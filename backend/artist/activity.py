@@ -0,0 +1,144 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.utils import timezone
+
+from .models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityRecorder:
+    """
+    Buffers UserActivity rows per process and writes them with bulk_create.
+
+    Events join the buffer when the surrounding transaction commits, so
+    rolled-back writes leave no activity behind. A daemon thread flushes
+    the buffer every ACTIVITY_FLUSH_INTERVAL seconds, or as soon as it
+    holds ACTIVITY_BUFFER_SIZE events, so requests never wait on the
+    insert. A batch the database can't take right now (a locked database)
+    goes back into the buffer, up to ACTIVITY_BUFFER_LIMIT events; a batch
+    with a row it rejects is written row by row so only that row is lost.
+    Whatever is left is flushed at interpreter shutdown. With
+    ACTIVITY_BUFFERING off, events are written synchronously instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.buffer = []
+        self.pid = None
+
+    @property
+    def buffer_size(self):
+        return getattr(settings, 'ACTIVITY_BUFFER_SIZE', 100)
+
+    @property
+    def buffer_limit(self):
+        return getattr(settings, 'ACTIVITY_BUFFER_LIMIT', 10000)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 2.0)
+
+    def record(self, **fields):
+        fields.setdefault('timestamp', timezone.now())
+        if not getattr(settings, 'ACTIVITY_BUFFERING', True):
+            UserActivity.objects.create(**fields)
+            return
+        transaction.on_commit(lambda: self.append(UserActivity(**fields)))
+
+    def append(self, activity):
+        with self.lock:
+            self.start_flusher()
+            self.buffer.append(activity)
+            full = len(self.buffer) >= self.buffer_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Write the buffered events; returns how many were written."""
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if not batch:
+            return 0
+        try:
+            # All or nothing, so a retry never duplicates rows.
+            with transaction.atomic():
+                UserActivity.objects.bulk_create(batch, batch_size=500)
+        except IntegrityError:
+            # Usually an event whose post or user was deleted meanwhile.
+            return self.write_each(batch)
+        except OperationalError:
+            logger.warning('Could not write %d activity events, will retry', len(batch), exc_info=True)
+            self.requeue(batch)
+            return 0
+        return len(batch)
+
+    def write_each(self, batch):
+        written = 0
+        for index, activity in enumerate(batch):
+            activity.pk = None
+            try:
+                with transaction.atomic():
+                    activity.save(force_insert=True)
+            except IntegrityError as error:
+                logger.warning(
+                    'Dropped activity event %r for user %s (post %s, user %s): %s', activity.action_type,
+                    activity.user_id, activity.target_post_id, activity.target_user_id, error,
+                )
+            except OperationalError:
+                logger.warning('Could not write %d activity events, will retry', len(batch) - index, exc_info=True)
+                self.requeue(batch[index:])
+                break
+            else:
+                written += 1
+        return written
+
+    def requeue(self, batch):
+        for activity in batch:
+            activity.pk = None
+            activity._state.adding = True
+        with self.lock:
+            self.buffer = batch + self.buffer
+            overflow = len(self.buffer) - self.buffer_limit
+            if overflow > 0:
+                # Oldest first: the newest events are the most useful.
+                del self.buffer[:overflow]
+        if overflow > 0:
+            logger.error('Dropped %d buffered activity events: the buffer is full', overflow)
+
+    def start_flusher(self):
+        # Called with the lock held. Also restarts the thread in a worker
+        # forked from a parent that already had one.
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        threading.Thread(target=self.run, name='activity-flusher', daemon=True).start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+recorder = ActivityRecorder()
+atexit.register(recorder.flush)
+
+
+def record_activity(user_id, action_type, description='', target_post_id=None, target_user_id=None):
+    recorder.record(
+        user_id=user_id,
+        action_type=action_type,
+        description=description,
+        target_post_id=target_post_id,
+        target_user_id=target_user_id,
+    )
@@ -0,0 +1,85 @@
+from django.http import JsonResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from core.authentication import aauthenticate
+
+from .models import CustomUser, Post, UserActivity
+from .pagination import ActivityPagination, KeysetPagination
+from .serializers import PostSerializer, UserActivityCompactSerializer, UserSerializer
+
+# Async, read-only counterparts of PostListCreateView, PostDetailView,
+# UserProfileView and UserActivityView for the ASGI deployment. They read
+# through the async ORM and only hand already-loaded rows to the
+# serializers, so a request never occupies a worker thread.
+
+NOT_AUTHENTICATED = {'detail': 'Authentication credentials were not provided.'}
+NOT_FOUND = {'detail': 'No matching object found.'}
+
+
+async def authenticated_request(request):
+    # OAuth2TokenMiddleware has usually resolved the bearer token already.
+    user = getattr(request, '_cached_user', None)
+    if user is None or not user.is_authenticated:
+        user = await aauthenticate(request)
+    if user is None:
+        return None
+    request = Request(request)
+    request.user = user
+    return request
+
+
+async def post_list(request):
+    request = await authenticated_request(request)
+    if request is None:
+        return JsonResponse(NOT_AUTHENTICATED, status=401)
+    paginator = KeysetPagination()
+    try:
+        posts = await paginator.apaginate_queryset(Post.objects.with_engagement(request.user), request)
+    except NotFound as e:
+        return JsonResponse({'detail': str(e.detail)}, status=404)
+    data = PostSerializer(posts, many=True, context={'request': request}).data
+    return JsonResponse({'next': paginator.get_next_link(), 'results': data})
+
+
+async def post_detail(request, pk):
+    request = await authenticated_request(request)
+    if request is None:
+        return JsonResponse(NOT_AUTHENTICATED, status=401)
+    post = await Post.objects.with_engagement(request.user).filter(pk=pk).afirst()
+    if post is None:
+        return JsonResponse(NOT_FOUND, status=404)
+    return JsonResponse(PostSerializer(post, context={'request': request}).data)
+
+
+async def user_profile(request, username):
+    request = await authenticated_request(request)
+    if request is None:
+        return JsonResponse(NOT_AUTHENTICATED, status=401)
+    if username == 'me':
+        user = request.user
+    else:
+        user = await CustomUser.objects.with_follow_state(request.user).filter(username=username).afirst()
+        if user is None:
+            return JsonResponse(NOT_FOUND, status=404)
+    return JsonResponse(UserSerializer(user, context={'request': request}).data)
+
+
+async def user_activity(request, username=None):
+    request = await authenticated_request(request)
+    if request is None:
+        return JsonResponse(NOT_AUTHENTICATED, status=401)
+    if username:
+        user = await CustomUser.objects.filter(username=username).afirst()
+        if user is None:
+            return JsonResponse(NOT_FOUND, status=404)
+    else:
+        user = request.user
+    paginator = ActivityPagination()
+    queryset = UserActivity.objects.filter(user=user).select_related('user', 'target_post', 'target_user')
+    try:
+        activities = await paginator.apaginate_queryset(queryset, request)
+    except NotFound as e:
+        return JsonResponse({'detail': str(e.detail)}, status=404)
+    data = UserActivityCompactSerializer(activities, many=True, context={'request': request}).data
+    return JsonResponse({'next': paginator.get_next_link(), 'results': data})
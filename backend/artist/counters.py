@@ -0,0 +1,88 @@
+from django.db.models import Count, F
+
+from .models import Comment, CustomUser, Follow, LikePost, Notification, Post, SavePost
+
+# Engagement model -> denormalized counter column on Post.
+POST_COUNTERS = {
+    LikePost: 'likes_count',
+    Comment: 'comments_count',
+    SavePost: 'saves_count',
+}
+
+
+def increment_post_counter(model, post_id):
+    field = POST_COUNTERS[model]
+    Post.objects.filter(pk=post_id).update(**{field: F(field) + 1})
+
+
+def decrement_post_counter(model, post_id):
+    field = POST_COUNTERS[model]
+    Post.objects.filter(pk=post_id, **{f'{field}__gt': 0}).update(**{field: F(field) - 1})
+
+
+def increment_follow_counters(follower_id, following_id):
+    CustomUser.objects.filter(pk=follower_id).update(following_count=F('following_count') + 1)
+    CustomUser.objects.filter(pk=following_id).update(followers_count=F('followers_count') + 1)
+
+
+def decrement_follow_counters(follower_id, following_id):
+    CustomUser.objects.filter(pk=follower_id, following_count__gt=0).update(following_count=F('following_count') - 1)
+    CustomUser.objects.filter(pk=following_id, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+
+
+def reconcile_post_counters(post_ids):
+    """Recompute the counters for ``post_ids``; returns the posts fixed."""
+    actual = {}
+    for model, field in POST_COUNTERS.items():
+        rows = (
+            model.objects.filter(post_id__in=post_ids)
+            .order_by()
+            .values('post_id')
+            .annotate(total=Count('pk'))
+        )
+        actual[field] = {row['post_id']: row['total'] for row in rows}
+
+    drifted = []
+    for post in Post.objects.filter(pk__in=post_ids).only('pk', *POST_COUNTERS.values()):
+        changed = False
+        for field, totals in actual.items():
+            value = totals.get(post.pk, 0)
+            if getattr(post, field) != value:
+                setattr(post, field, value)
+                changed = True
+        if changed:
+            drifted.append(post)
+
+    Post.objects.bulk_update(drifted, list(POST_COUNTERS.values()))
+    return len(drifted)
+
+
+def reconcile_user_counters(user_ids):
+    """Recompute the per-user counters for ``user_ids``; returns the users fixed."""
+    actual = {}
+    for field, queryset, column in (
+        ('followers_count', Follow.objects.all(), 'following_id'),
+        ('following_count', Follow.objects.all(), 'follower_id'),
+        ('unread_notifications_count', Notification.objects.filter(is_read=False), 'recipient_id'),
+    ):
+        rows = (
+            queryset.filter(**{f'{column}__in': user_ids})
+            .order_by()
+            .values(column)
+            .annotate(total=Count('pk'))
+        )
+        actual[field] = {row[column]: row['total'] for row in rows}
+
+    drifted = []
+    for user in CustomUser.objects.filter(pk__in=user_ids).only('pk', *CustomUser.COUNTER_FIELDS):
+        changed = False
+        for field, totals in actual.items():
+            value = totals.get(user.pk, 0)
+            if getattr(user, field) != value:
+                setattr(user, field, value)
+                changed = True
+        if changed:
+            drifted.append(user)
+
+    CustomUser.objects.bulk_update(drifted, list(CustomUser.COUNTER_FIELDS))
+    return len(drifted)
@@ -0,0 +1,33 @@
+from core.events import publish
+
+from .models import CustomUser, Post
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def publish_engagement(post_id):
+    # The counters were bumped with F() expressions, so they are read back,
+    # but only when someone is listening on the post.
+    def message():
+        counts = Post.objects.filter(pk=post_id).values('likes_count', 'comments_count', 'saves_count').first()
+        if counts:
+            return {'type': 'engagement', 'post_id': post_id, **counts}
+
+    publish(post_channel(post_id), message)
+
+
+def publish_notification(recipient_id):
+    def message():
+        unread_count = CustomUser.objects.filter(pk=recipient_id).values_list(
+            'unread_notifications_count', flat=True
+        ).first()
+        if unread_count is not None:
+            return {'type': 'notification', 'unread_count': unread_count}
+
+    publish(user_channel(recipient_id), message)
@@ -0,0 +1,93 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Longest edge, in pixels, of each derivative. Images are never upscaled.
+VARIANT_SIZES = {
+    'thumbnail': 320,
+    'medium': 800,
+    'large': 1600,
+}
+
+# srcset key -> (Pillow format, file extension, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def needs_variants(field_file, variants):
+    if not field_file:
+        return bool(variants)
+    return (variants or {}).get('source') != field_file.name
+
+
+def generate_variants(field_file):
+    """Write every size/format derivative of ``field_file`` to its storage.
+
+    Returns the map stored on the model: the source name plus, per size,
+    the storage name of each format.
+    """
+    storage = field_file.storage
+    stem = os.path.splitext(field_file.name)[0]
+    variants = {'source': field_file.name}
+
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'L'):
+                original = original.convert('RGB')
+            for size, edge in VARIANT_SIZES.items():
+                image = original.copy()
+                image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+                variants[size] = {}
+                for key, (image_format, extension, options) in VARIANT_FORMATS.items():
+                    buffer = BytesIO()
+                    image.save(buffer, image_format, **options)
+                    name = f'{stem}_{size}.{extension}'
+                    if storage.exists(name):
+                        storage.delete(name)
+                    variants[size][key] = storage.save(name, ContentFile(buffer.getvalue()))
+    finally:
+        field_file.close()
+    return variants
+
+
+def variant_names(variants):
+    return {
+        name
+        for size in VARIANT_SIZES
+        for name in (variants or {}).get(size, {}).values()
+    }
+
+
+def refresh_variants(instance, field_name, variants_field_name):
+    """Regenerate ``instance``'s variants if its image changed since the last run."""
+    field_file = getattr(instance, field_name)
+    old_variants = getattr(instance, variants_field_name)
+    if not needs_variants(field_file, old_variants):
+        return False
+
+    variants = generate_variants(field_file) if field_file else {}
+    for name in variant_names(old_variants) - variant_names(variants):
+        field_file.storage.delete(name)
+    setattr(instance, variants_field_name, variants)
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field_name: variants})
+    return True
+
+
+def build_srcset(field_file, variants, request=None):
+    if not field_file or not variants:
+        return {}
+    srcset = {}
+    for size in VARIANT_SIZES:
+        if size not in variants:
+            continue
+        srcset[size] = {}
+        for key, name in variants[size].items():
+            url = field_file.storage.url(name)
+            srcset[size][key] = request.build_absolute_uri(url) if request else url
+    return srcset
@@ -0,0 +1,88 @@
+import asyncio
+import secrets
+import statistics
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model
+
+from artist.models import CustomUser
+
+# Pairs of (sync, async) endpoints serving the same data.
+ENDPOINTS = (
+    ('posts', '/api/posts/', '/api/async/posts/'),
+    ('profile', '/api/users/me/', '/api/async/users/me/'),
+    ('activity', '/api/user-activity/', '/api/async/user-activity/'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and latency of the sync and async read endpoints under ASGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to authenticate as (defaults to the first user).')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(is_active=True).order_by('pk')
+        if options['username']:
+            user = user.filter(username=options['username'])
+        user = user.first()
+        if user is None:
+            raise CommandError('No matching active user to benchmark with.')
+
+        access_token = get_access_token_model().objects.create(
+            user=user,
+            token=secrets.token_urlsafe(32),
+            expires=timezone.now() + timedelta(minutes=10),
+            scope='read write',
+        )
+        try:
+            headers = {'Authorization': f'Bearer {access_token.token}'}
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for label, sync_url, async_url in ENDPOINTS:
+                    for kind, url in (('sync', sync_url), ('async', async_url)):
+                        result = async_to_sync(self.run_load)(
+                            url, headers, options['requests'], options['concurrency']
+                        )
+                        self.stdout.write(
+                            f'{label:<10} {kind:<6} {result["rps"]:8.1f} req/s  '
+                            f'p50 {result["p50"]:7.1f} ms  p95 {result["p95"]:7.1f} ms  '
+                            f'errors {result["errors"]}'
+                        )
+        finally:
+            access_token.delete()
+
+    async def run_load(self, url, headers, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def fetch():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'rps': total / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': latencies[max(0, int(len(latencies) * 0.95) - 1)],
+            'errors': errors,
+        }
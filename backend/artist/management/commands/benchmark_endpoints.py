@@ -0,0 +1,165 @@
+import json
+import secrets
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model
+
+from artist.models import CustomUser, Post
+from ecommerce.models import Cart, CartItem
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main endpoints with the test client and write p50/p95 latency, '
+        'query counts and allocated memory to a JSON baseline. Run it after seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to benchmark as (defaults to the user following the most accounts).')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--memory-iterations', type=int, default=5,
+                            help='Separate runs under tracemalloc, so tracing does not skew latency.')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='A previous baseline to report changes against.')
+
+    def handle(self, *args, **options):
+        self.viewer = self.get_viewer(options['username'])
+        profile = CustomUser.objects.exclude(pk=self.viewer.pk).order_by('-followers_count').first() or self.viewer
+        access_token = get_access_token_model().objects.create(
+            user=self.viewer,
+            token=secrets.token_urlsafe(32),
+            expires=timezone.now() + timedelta(hours=1),
+            scope='read write',
+        )
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {access_token.token}')
+
+        endpoints = {
+            'posts': lambda: self.get('/api/posts/'),
+            'user_profile': lambda: self.get(f'/api/users/{profile.username}/'),
+            'user_activity': lambda: self.get(f'/api/user-activity/{profile.username}/'),
+            'checkout': self.checkout,
+        }
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for name, request in endpoints.items():
+                    results[name] = self.measure(request, options)
+                    self.stdout.write(self.format_result(name, results[name]))
+        finally:
+            access_token.delete()
+
+        baseline = {
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'rows': {'users': CustomUser.objects.count(), 'posts': Post.objects.count()},
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(baseline, output, indent=2, sort_keys=True)
+            output.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def get_viewer(self, username):
+        users = CustomUser.objects.filter(is_active=True)
+        viewer = users.filter(username=username).first() if username else users.order_by('-following_count').first()
+        if viewer is None:
+            raise CommandError('No user to benchmark as; run seed_data first.')
+        return viewer
+
+    def get(self, path):
+        return self.timed(lambda: self.client.get(path))
+
+    def checkout(self):
+        # Each checkout runs against a fresh one-item cart and is rolled back,
+        # so every iteration buys the same artwork.
+        post = Post.objects.filter(price__isnull=False, is_sold=False).order_by('pk').first()
+        if post is None:
+            raise CommandError('No unsold artwork with a price to check out.')
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=self.viewer)
+            cart.items.all().delete()
+            CartItem.objects.create(cart=cart, post=post)
+            response = self.timed(lambda: self.client.post('/ecommerce/checkout/'))
+            transaction.set_rollback(True)
+        return response
+
+    def timed(self, request):
+        # Only the request itself counts towards latency and queries, not the
+        # setup an endpoint needs. The query log is capped, so start it empty.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - start
+        self.last_sample = (elapsed * 1000, len(queries))
+        return response
+
+    def run_once(self, request):
+        response = request()
+        if response.status_code >= 400:
+            raise CommandError(f'{response.status_code} from {response.wsgi_request.path}: {response.content[:200]!r}')
+        return self.last_sample
+
+    def measure(self, request, options):
+        for _ in range(options['warmup']):
+            self.run_once(request)
+
+        latencies, query_counts = [], []
+        for _ in range(options['iterations']):
+            latency, queries = self.run_once(request)
+            latencies.append(latency)
+            query_counts.append(queries)
+
+        allocated = []
+        for _ in range(options['memory_iterations']):
+            tracemalloc.start()
+            try:
+                self.run_once(request)
+                allocated.append(tracemalloc.get_traced_memory()[1] / 1024)
+            finally:
+                tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'queries': max(query_counts),
+            'peak_kib': round(statistics.median(allocated), 1) if allocated else None,
+        }
+
+    def format_result(self, name, result):
+        return (
+            f'{name:<14} p50 {result["p50_ms"]:8.2f} ms  p95 {result["p95_ms"]:8.2f} ms  '
+            f'queries {result["queries"]:3d}  peak {result["peak_kib"]} KiB'
+        )
+
+    def compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['endpoints']
+        for name, result in results.items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            changes = []
+            for metric in ('p50_ms', 'p95_ms', 'queries', 'peak_kib'):
+                if before.get(metric) and result.get(metric) is not None:
+                    change = (result[metric] - before[metric]) / before[metric] * 100
+                    changes.append(f'{metric} {change:+.1f}%')
+            self.stdout.write(f'{name:<14} ' + '  '.join(changes))
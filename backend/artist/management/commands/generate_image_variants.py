@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from artist.images import generate_variants, needs_variants
+from artist.models import CustomUser, Post
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive image variants for existing post images and profile pictures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that are already up to date.')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        for model, field_name, variants_field_name in (
+            (Post, 'image', 'image_variants'),
+            (CustomUser, 'profile_picture', 'profile_picture_variants'),
+        ):
+            generated = failed = 0
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            queryset = queryset.only('pk', field_name, variants_field_name).order_by('pk')
+            for instance in queryset.iterator(chunk_size=options['batch_size']):
+                field_file = getattr(instance, field_name)
+                if not options['force'] and not needs_variants(field_file, getattr(instance, variants_field_name)):
+                    continue
+                try:
+                    variants = generate_variants(field_file)
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} {instance.pk}: {e}')
+                    continue
+                model.objects.filter(pk=instance.pk).update(**{variants_field_name: variants})
+                generated += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: generated variants for {generated} images, {failed} failed.'
+            ))
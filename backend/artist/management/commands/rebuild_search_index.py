@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from artist import search
+from artist.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over posts.'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search requires the SQLite backend.')
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {Post.objects.count()} posts.'))
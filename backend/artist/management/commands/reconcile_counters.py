@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from artist.counters import reconcile_post_counters, reconcile_user_counters
+from artist.models import CustomUser, Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized engagement counters to repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, reconcile, label in (
+            (Post, reconcile_post_counters, 'posts'),
+            (CustomUser, reconcile_user_counters, 'users'),
+        ):
+            checked, fixed = self.reconcile_in_batches(model, reconcile, batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} {label}, fixed {fixed}.'))
+
+    def reconcile_in_batches(self, model, reconcile, batch_size):
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            ids = list(
+                model.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            fixed += reconcile(ids)
+            checked += len(ids)
+            last_id = ids[-1]
+        return checked, fixed
@@ -0,0 +1,266 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from artist import search, timeline
+from artist.models import (
+    Comment, CustomUser, Follow, LikePost, Post, SavePost, TimelineEntry, UserActivity,
+    normalize_search_key,
+)
+from ecommerce.models import Cart, CartItem, Order, OrderItem
+
+USERNAME_PREFIX = 'seed_'
+FIRST_NAMES = ['Ava', 'Noah', 'Mia', 'Liam', 'Zoé', 'Mateo', 'Aisha', 'Kenji', 'Ingrid', 'Ravi', 'Lucía', 'Omar']
+LAST_NAMES = ['Rossi', 'Nguyen', 'Okafor', 'Müller', 'Tanaka', 'García', 'Singh', 'Dubois', 'Kowalski', 'Reddy']
+TITLE_WORDS = [
+    'quiet', 'harbor', 'study', 'crimson', 'morning', 'garden', 'portrait', 'storm', 'blue', 'river',
+    'fragment', 'light', 'city', 'still', 'life', 'dream', 'echo', 'golden', 'north', 'window',
+]
+
+
+def zipf_weights(count, exponent):
+    # Rank i gets weight 1 / (i + 1) ** exponent: a few very popular items
+    # and a long tail, like real follow graphs and engagement.
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the timestamps we set instead of auto_now(_add)."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Seed reproducible synthetic users, follows, posts, engagement, carts and orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=3000)
+        parser.add_argument('--follows-per-user', type=int, default=20, help='Average follows per user.')
+        parser.add_argument('--likes', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true', help='Delete previously seeded users first.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        seeded = CustomUser.objects.filter(username__startswith=USERNAME_PREFIX)
+        if seeded.exists():
+            if not options['replace']:
+                raise CommandError('Seeded data already exists; pass --replace to recreate it.')
+            seeded.delete()
+
+        with transaction.atomic(), explicit_timestamps(Post, Comment, Follow, LikePost, SavePost, Order):
+            users = self.create_users(options['users'])
+            self.create_follows(users, options['follows_per_user'])
+            posts = self.create_posts(users, options['posts'])
+            self.create_engagement(users, posts, options['likes'], options['comments'])
+            self.create_orders(users, posts, options['orders'])
+            self.create_carts(users, posts, options['carts'])
+            self.create_timelines()
+
+        # bulk_create skips the signals that maintain these.
+        call_command('reconcile_counters', batch_size=self.batch_size, stdout=self.stdout)
+        if search.is_available():
+            call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(posts)} posts (seed {options["seed"]}).'
+        ))
+
+    def bulk_create(self, model, objs, **kwargs):
+        return model.objects.bulk_create(objs, batch_size=self.batch_size, **kwargs)
+
+    def random_time(self, days=90, after=None):
+        start = after or self.now - timedelta(days=days)
+        span = (self.now - start).total_seconds()
+        return start + timedelta(seconds=self.rng.uniform(0, span))
+
+    def create_users(self, count):
+        # Hashing once keeps seeding fast; every seeded user's password is "password".
+        password = make_password('password')
+        users = []
+        for index in range(count):
+            username = f'{USERNAME_PREFIX}{index:06d}'
+            first_name, last_name = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            users.append(CustomUser(
+                username=username,
+                email=f'{username}@example.com',
+                password=password,
+                first_name=first_name,
+                last_name=last_name,
+                username_key=normalize_search_key(username),
+                name_key=normalize_search_key(f'{first_name} {last_name}'),
+                last_name_key=normalize_search_key(last_name),
+                date_joined=self.random_time(days=365),
+            ))
+        self.bulk_create(CustomUser, users)
+        return list(CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk'))
+
+    def create_follows(self, users, per_user):
+        weights = zipf_weights(len(users), 1.1)
+        popularity = users[:]
+        self.rng.shuffle(popularity)
+        follows = []
+        for user in users:
+            count = min(len(users) - 1, int(self.rng.expovariate(1 / per_user)) + 1)
+            targets = {target.pk for target in self.rng.choices(popularity, weights=weights, k=count)}
+            targets.discard(user.pk)
+            created_at = self.random_time(after=user.date_joined)
+            follows.extend(
+                Follow(follower=user, following_id=target, created_at=created_at, updated_at=created_at)
+                for target in sorted(targets)
+            )
+        self.bulk_create(Follow, follows)
+
+    def create_posts(self, users, count):
+        weights = zipf_weights(len(users), 0.8)
+        categories = [choice for choice, _ in Post.CATEGORY_CHOICES]
+        posts = []
+        for _ in range(count):
+            created_at = self.random_time()
+            for_sale = self.rng.random() < 0.4
+            posts.append(Post(
+                user=self.rng.choices(users, weights=weights)[0],
+                title=' '.join(self.rng.sample(TITLE_WORDS, 3)).capitalize(),
+                description=' '.join(self.rng.choices(TITLE_WORDS, k=20)),
+                category=self.rng.choice(categories),
+                price=Decimal(self.rng.randrange(50, 5000)) if for_sale else None,
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        self.bulk_create(Post, posts)
+        posts = list(Post.objects.filter(user__username__startswith=USERNAME_PREFIX).order_by('pk'))
+        UserActivity.objects.bulk_create(
+            [UserActivity(user_id=post.user_id, action_type='post', target_post=post,
+                          timestamp=post.created_at, description=f'Created post: {post.title}')
+             for post in posts],
+            batch_size=self.batch_size,
+        )
+        return posts
+
+    def engagement_pairs(self, users, posts, count):
+        weights = zipf_weights(len(posts), 1.0)
+        popularity = posts[:]
+        self.rng.shuffle(popularity)
+        pairs = set()
+        for _ in range(count):
+            pairs.add((self.rng.choice(users), self.rng.choices(popularity, weights=weights)[0]))
+        return sorted(pairs, key=lambda pair: (pair[0].pk, pair[1].pk))
+
+    def create_engagement(self, users, posts, likes, comments):
+        activities = []
+        like_rows = []
+        for user, post in self.engagement_pairs(users, posts, likes):
+            created_at = self.random_time(after=post.created_at)
+            like_rows.append(LikePost(user=user, post=post, created_at=created_at, updated_at=created_at))
+            activities.append(UserActivity(user=user, action_type='like', target_post=post, timestamp=created_at,
+                                           description=f'Liked post: {post.title}'))
+        self.bulk_create(LikePost, like_rows, ignore_conflicts=True)
+
+        save_rows = []
+        for user, post in self.engagement_pairs(users, posts, likes // 4):
+            created_at = self.random_time(after=post.created_at)
+            save_rows.append(SavePost(user=user, post=post, created_at=created_at, updated_at=created_at))
+        self.bulk_create(SavePost, save_rows, ignore_conflicts=True)
+
+        comment_rows = []
+        weights = zipf_weights(len(posts), 1.0)
+        for _ in range(comments):
+            user, post = self.rng.choice(users), self.rng.choices(posts, weights=weights)[0]
+            created_at = self.random_time(after=post.created_at)
+            comment_rows.append(Comment(user=user, post=post, content=' '.join(self.rng.choices(TITLE_WORDS, k=8)),
+                                        created_at=created_at, updated_at=created_at))
+            activities.append(UserActivity(user=user, action_type='comment', target_post=post, timestamp=created_at,
+                                           description=f'Commented on post: {post.title}'))
+        self.bulk_create(Comment, comment_rows)
+        self.bulk_create(UserActivity, activities)
+
+    def create_orders(self, users, posts, count):
+        for_sale = [post for post in posts if post.price is not None]
+        self.rng.shuffle(for_sale)
+        sold = []
+        orders = []
+        order_items = []
+        for _ in range(count):
+            if not for_sale:
+                break
+            buyer = self.rng.choice(users)
+            bought = [for_sale.pop() for _ in range(min(len(for_sale), self.rng.randint(1, 3)))]
+            order = Order(user=buyer, status=self.rng.choice(Order.STATUS_CHOICES)[0],
+                          total_amount=sum(post.price for post in bought), created_at=self.random_time())
+            orders.append(order)
+            order_items.append([OrderItem(post=post, price=post.price, quantity=1) for post in bought])
+            sold.extend(post.pk for post in bought)
+        self.bulk_create(Order, orders)
+        for order, items in zip(orders, order_items):
+            for item in items:
+                item.order = order
+        self.bulk_create(OrderItem, [item for items in order_items for item in items])
+        Post.objects.filter(pk__in=sold).update(is_sold=True)
+
+    def create_carts(self, users, posts, count):
+        available = list(Post.objects.filter(
+            user__username__startswith=USERNAME_PREFIX, price__isnull=False, is_sold=False,
+        ).values_list('pk', flat=True))
+        if not available:
+            return
+        shoppers = self.rng.sample(users, min(count, len(users)))
+        self.bulk_create(Cart, [Cart(user=user) for user in shoppers])
+        carts = Cart.objects.filter(user__in=shoppers)
+        items = []
+        for cart in carts:
+            for post_id in self.rng.sample(available, min(len(available), self.rng.randint(1, 3))):
+                items.append(CartItem(cart=cart, post_id=post_id, quantity=1))
+        self.bulk_create(CartItem, items)
+
+    def create_timelines(self):
+        # Mirror artist.timeline: followers of authors under the fan-out limit
+        # get those authors' most recent posts materialized.
+        limit = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+        backfill = getattr(settings, 'TIMELINE_BACKFILL_SIZE', 100)
+        follows = Follow.objects.filter(follower__username__startswith=USERNAME_PREFIX)
+        followers = {}
+        for follower_id, following_id in follows.values_list('follower_id', 'following_id'):
+            followers.setdefault(following_id, []).append(follower_id)
+        entries = []
+        for author_id, follower_ids in followers.items():
+            if len(follower_ids) > limit:
+                continue
+            recent = Post.objects.filter(user_id=author_id).order_by('-created_at').values_list('pk', 'created_at')
+            for post_id, created_at in recent[:backfill]:
+                entries.extend(
+                    TimelineEntry(user_id=follower_id, post_id=post_id, created_at=created_at)
+                    for follower_id in follower_ids
+                )
+            if len(entries) >= self.batch_size:
+                self.bulk_create(TimelineEntry, entries, ignore_conflicts=True)
+                entries = []
+        self.bulk_create(TimelineEntry, entries, ignore_conflicts=True)
+        follower_ids = sorted({follower_id for ids in followers.values() for follower_id in ids})
+        for start in range(0, len(follower_ids), self.batch_size):
+            timeline.cap_timelines(follower_ids[start:start + self.batch_size])
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.2 on 2026-10-18 02:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('artist', 'CustomUser')
+    Follow = apps.get_model('artist', 'Follow')
+    updates = {}
+    for field, column in (('followers_count', 'following'), ('following_count', 'follower')):
+        totals = (
+            Follow.objects.filter(**{column: OuterRef('pk')})
+            .order_by()
+            .values(column)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        updates[field] = Coalesce(Subquery(totals), 0)
+    CustomUser.objects.update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0006_post_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
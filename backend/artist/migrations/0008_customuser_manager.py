@@ -0,0 +1,20 @@
+# Generated by Django 5.2.2 on 2026-10-18 02:59
+
+import artist.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0007_customuser_follow_counters'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='customuser',
+            managers=[
+                ('objects', artist.models.CustomUserManager()),
+            ],
+        ),
+    ]
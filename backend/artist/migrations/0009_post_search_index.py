@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# The index as it stood at this migration; artist.search keeps it in sync
+# with the posts and can rebuild it.
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS artist_post_fts "
+            "USING fts5(title, description, category, tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute("DELETE FROM artist_post_fts")
+        cursor.execute(
+            "INSERT INTO artist_post_fts (rowid, title, description, category) "
+            "SELECT id, title, description, category FROM artist_post"
+        )
+        cursor.execute("INSERT INTO artist_post_fts (artist_post_fts) VALUES ('optimize')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS artist_post_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0008_customuser_manager'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
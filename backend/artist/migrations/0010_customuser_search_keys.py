@@ -0,0 +1,46 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:01
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_search_key(value):
+    # artist.models.normalize_search_key as it stood at this migration.
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.casefold().split())
+
+
+def backfill_search_keys(apps, schema_editor):
+    CustomUser = apps.get_model('artist', 'CustomUser')
+    users = []
+    for user in CustomUser.objects.only('username', 'first_name', 'last_name').iterator(chunk_size=1000):
+        user.username_key = normalize_search_key(user.username)
+        user.name_key = normalize_search_key(f'{user.first_name} {user.last_name}')
+        users.append(user)
+        if len(users) >= 1000:
+            CustomUser.objects.bulk_update(users, ['username_key', 'name_key'])
+            users = []
+    CustomUser.objects.bulk_update(users, ['username_key', 'name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0009_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=301),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='username_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=150),
+        ),
+        migrations.RunPython(backfill_search_keys, migrations.RunPython.noop),
+    ]
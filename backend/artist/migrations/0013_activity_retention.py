@@ -0,0 +1,40 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0012_useractivity_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_type', models.CharField(choices=[('post', 'Created Post'), ('comment', 'Commented'), ('like', 'Liked'), ('save', 'Saved Post'), ('follow', 'Followed User')], max_length=20)),
+                ('date', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['timestamp'], name='artist_activity_timestamp'),
+        ),
+        migrations.AddField(
+            model_name='useractivitydailysummary',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_summaries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='useractivitydailysummary',
+            unique_together={('user', 'action_type', 'date')},
+        ),
+    ]
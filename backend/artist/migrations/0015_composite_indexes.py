@@ -0,0 +1,76 @@
+# Generated by Django 5.2.2 on 2026-10-18 03:16
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    # Keep the oldest row of each pair and recount the affected users.
+    CustomUser = apps.get_model('artist', 'CustomUser')
+    Follow = apps.get_model('artist', 'Follow')
+    duplicates = (
+        Follow.objects.values('follower', 'following')
+        .annotate(keep=Min('pk'), total=Count('pk'))
+        .filter(total__gt=1)
+    )
+    affected = set()
+    for row in duplicates:
+        Follow.objects.filter(follower=row['follower'], following=row['following']).exclude(pk=row['keep']).delete()
+        affected.update((row['follower'], row['following']))
+    if not affected:
+        return
+    updates = {}
+    for field, column in (('followers_count', 'following'), ('following_count', 'follower')):
+        totals = (
+            Follow.objects.filter(**{column: OuterRef('pk')})
+            .order_by()
+            .values(column)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        updates[field] = Coalesce(Subquery(totals), 0)
+    CustomUser.objects.filter(pk__in=affected).update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0014_notifications'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='artist_notif_recipient_updated',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at'], name='artist_comment_post_created'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'updated_at'], name='artist_notif_recipient_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created_at'], name='artist_post_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', 'created_at'], name='artist_post_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', 'is_sold', 'created_at'], name='artist_post_category_created'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'timestamp'], name='artist_activity_user_time'),
+        ),
+        migrations.RunPython(remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('follower', 'following'), name='artist_follow_unique'),
+        ),
+    ]
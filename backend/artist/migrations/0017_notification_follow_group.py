@@ -0,0 +1,46 @@
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def merge_duplicate_groups(apps, schema_editor):
+    # The old constraint let unread groups without a post (follows) repeat.
+    # Keep the most recent one and mark the others read.
+    Notification = apps.get_model('artist', 'Notification')
+    CustomUser = apps.get_model('artist', 'CustomUser')
+    duplicates = (
+        Notification.objects.filter(is_read=False, target_post__isnull=True)
+        .values('recipient_id', 'verb')
+        .annotate(groups=models.Count('id'))
+        .filter(groups__gt=1)
+    )
+    for duplicate in duplicates:
+        unread = Notification.objects.filter(
+            recipient_id=duplicate['recipient_id'], verb=duplicate['verb'],
+            is_read=False, target_post__isnull=True,
+        )
+        latest = unread.order_by('-updated_at', '-id').first()
+        marked = unread.exclude(pk=latest.pk).update(is_read=True)
+        CustomUser.objects.filter(pk=duplicate['recipient_id']).update(
+            unread_notifications_count=django.db.models.functions.comparison.Greatest(
+                models.F('unread_notifications_count') - marked, 0
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0016_timeline_entry_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_groups, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='notification',
+            name='artist_notif_one_unread_group',
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(models.F('recipient'), models.F('verb'), django.db.models.functions.comparison.Coalesce('target_post', 0, output_field=models.BigIntegerField()), condition=models.Q(('is_read', False)), name='artist_notif_one_unread_group'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-18 04:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_last_actors(apps, schema_editor):
+    # Earlier actors of an unread group were never recorded; its last one is.
+    Notification = apps.get_model('artist', 'Notification')
+    NotificationActor = apps.get_model('artist', 'NotificationActor')
+    unread = Notification.objects.filter(is_read=False, last_actor__isnull=False).values_list('id', 'last_actor_id')
+    NotificationActor.objects.bulk_create(
+        [NotificationActor(notification_id=id, actor_id=actor_id) for id, actor_id in unread.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0017_notification_follow_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='artist.notification')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('notification', 'actor'), name='artist_notif_actor_unique')],
+            },
+        ),
+        migrations.RunPython(record_last_actors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize_search_key(value):
+    # artist.models.normalize_search_key as it stood at this migration.
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.casefold().split())
+
+
+def backfill_last_name_key(apps, schema_editor):
+    CustomUser = apps.get_model('artist', 'CustomUser')
+    users = []
+    for user in CustomUser.objects.exclude(last_name='').only('last_name').iterator(chunk_size=1000):
+        user.last_name_key = normalize_search_key(user.last_name)
+        users.append(user)
+        if len(users) >= 1000:
+            CustomUser.objects.bulk_update(users, ['last_name_key'])
+            users = []
+    CustomUser.objects.bulk_update(users, ['last_name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artist', '0018_notification_actors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='last_name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=150),
+        ),
+        migrations.RunPython(backfill_last_name_key, migrations.RunPython.noop),
+    ]
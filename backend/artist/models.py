@@ -1,13 +1,99 @@
-from django.contrib.auth.models import AbstractUser
+import unicodedata
+
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def normalize_search_key(value):
+    # Case- and accent-insensitive form used by the autocomplete indexes.
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.casefold().split())
+
+
+class CustomUserQuerySet(models.QuerySet):
+    def with_follow_state(self, viewer):
+        # Resolves UserSerializer.is_following for a whole page of users in
+        # the same query instead of one EXISTS per row.
+        if viewer is None or not viewer.is_authenticated:
+            return self.annotate(is_following=Value(False))
+        return self.annotate(
+            is_following=Exists(Follow.objects.filter(follower=viewer, following=OuterRef('pk')))
+        )
+
+    def with_key_prefix(self, field, prefix):
+        # An index range scan (key >= prefix AND key < prefix + U+10FFFF) in
+        # index order, so a LIMIT stops after the first few matching entries.
+        prefix = normalize_search_key(prefix)
+        if not prefix:
+            return self.none()
+        return self.filter(**{
+            f'{field}__gte': prefix,
+            f'{field}__lt': prefix + '\U0010ffff',
+        }).order_by(field)
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    pass
 
 
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    unread_notifications_count = models.PositiveIntegerField(default=0)
+    username_key = models.CharField(max_length=150, blank=True, db_index=True, editable=False)
+    name_key = models.CharField(max_length=301, blank=True, db_index=True, editable=False)
+    # name_key starts with the first name, so a surname prefix needs its own key.
+    last_name_key = models.CharField(max_length=150, blank=True, db_index=True, editable=False)
+
+    objects = CustomUserManager()
+
+    # Maintained with F() updates by artist.counters and
+    # artist.notifications.
+    COUNTER_FIELDS = ('followers_count', 'following_count', 'unread_notifications_count')
+
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        self.username_key = normalize_search_key(self.username)
+        self.name_key = normalize_search_key(f'{self.first_name} {self.last_name}')
+        self.last_name_key = normalize_search_key(self.last_name)
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        elif update_fields is not None and {'username', 'first_name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'username_key', 'name_key', 'last_name_key'}
+        super().save(*args, **kwargs)
+
+
+class PostQuerySet(models.QuerySet):
+    def with_engagement(self, viewer=None):
+        # Everything PostSerializer (and the nested author UserSerializer)
+        # needs beyond the counter columns, fetched in the same query as the
+        # posts themselves.
+        queryset = self.select_related('user')
+        if viewer is not None and viewer.is_authenticated:
+            return queryset.annotate(
+                is_liked=Exists(LikePost.objects.filter(post=OuterRef('pk'), user=viewer)),
+                is_saved=Exists(SavePost.objects.filter(post=OuterRef('pk'), user=viewer)),
+                user_is_following=Exists(Follow.objects.filter(follower=viewer, following=OuterRef('user'))),
+            )
+        return queryset.annotate(
+            is_liked=Value(False),
+            is_saved=Value(False),
+            user_is_following=Value(False),
+        )
+
 
 class Post(models.Model):
 
@@ -23,14 +109,41 @@ class Post(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
     description = models.TextField()
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null= True)
     is_sold = models.BooleanField(default=False)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    saves_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 
+    objects = PostQuerySet.as_manager()
+
+    # Maintained with F() updates by artist.counters, so a full-row save
+    # must not write back a possibly stale in-memory copy.
+    COUNTER_FIELDS = ('likes_count', 'comments_count', 'saves_count')
+
+    class Meta:
+        # Ascending on purpose: scanned backwards they yield newest first with
+        # the implicit id tiebreak descending too, matching KeysetPagination.
+        indexes = [
+            models.Index(fields=['created_at'], name='artist_post_created'),
+            models.Index(fields=['user', 'created_at'], name='artist_post_user_created'),
+            models.Index(fields=['category', 'is_sold', 'created_at'], name='artist_post_category_created'),
+        ]
+
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
 
 class SavePost(models.Model):
@@ -63,6 +176,12 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='artist_comment_post_created'),
+        ]
+
     def __str__(self):
         return self.content
 
@@ -71,6 +190,14 @@ class Follow(models.Model):
     following = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='followers')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # The unique index also serves "does A follow B" lookups; lookups
+        # by ``following`` use the foreign key's own index.
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'following'], name='artist_follow_unique'),
+        ]
+
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
 
@@ -88,13 +215,100 @@ class UserActivity(models.Model):
     action_type = models.CharField(max_length=20, choices=ACTION_TYPES)
     target_post = models.ForeignKey(Post, null=True, blank=True, on_delete=models.CASCADE)
     target_user = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.CASCADE, related_name='targeted_activities')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     description = models.TextField(blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='artist_activity_timestamp'),
+            models.Index(fields=['user', 'timestamp'], name='artist_activity_user_time'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} {self.action_type} at {self.timestamp}"
 
 
+class UserActivityDailySummary(models.Model):
+    # Per-user, per-action daily counts kept for activity that has aged out
+    # of the raw UserActivity table (see the archive_activity command).
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='activity_summaries')
+    action_type = models.CharField(max_length=20, choices=UserActivity.ACTION_TYPES)
+    date = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'action_type', 'date')
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.user.username} {self.action_type} x{self.count} on {self.date}"
+
+
+class TimelineEntry(models.Model):
+    # Materialized "following" feed: one row per (follower, post), written
+    # when the post is created and capped at TIMELINE_MAX_ENTRIES per user.
+    # created_at mirrors the post's so the feed can be read in order from the
+    # (user, created_at, post) index.
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            # Ascending: SQLite walks it backwards for the newest-first feed,
+            # post included so the tiebreak needs no sort either.
+            models.Index(fields=['user', 'created_at', 'post'], name='artist_timeline_user_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.post.title} in {self.user.username}'s timeline"
+
+
+class Notification(models.Model):
+    # One row per (recipient, verb, post) while unread: further events are
+    # folded into it ("X and 41 others liked ...") instead of adding rows.
+    VERB_CHOICES = [
+        ('like', 'Liked'),
+        ('comment', 'Commented on'),
+        ('save', 'Saved'),
+        ('follow', 'Followed'),
+    ]
+
+    recipient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
+    verb = models.CharField(max_length=20, choices=VERB_CHOICES)
+    target_post = models.ForeignKey(Post, null=True, blank=True, on_delete=models.CASCADE, related_name='notifications')
+    last_actor = models.ForeignKey(CustomUser, null=True, on_delete=models.SET_NULL, related_name='+')
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'updated_at'], name='artist_notif_recipient_updated'),
+        ]
+        constraints = [
+            # NULLs never collide in a unique index, so follow groups (no
+            # post) are keyed on 0 instead.
+            models.UniqueConstraint(
+                'recipient', 'verb', Coalesce('target_post', 0, output_field=models.BigIntegerField()),
+                condition=models.Q(is_read=False),
+                name='artist_notif_one_unread_group',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.verb} x{self.actor_count} for {self.recipient.username}"
+
+
+class NotificationActor(models.Model):
+    # Who has been folded into a group, so actor_count counts each actor once.
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    actor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'actor'], name='artist_notif_actor_unique'),
+        ]
@@ -0,0 +1,59 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .events import publish_notification
+from .models import CustomUser, Notification, NotificationActor
+
+
+def notify(recipient_id, verb, actor_id, target_post_id=None):
+    if recipient_id == actor_id:
+        return
+    group = Notification.objects.filter(
+        recipient_id=recipient_id, verb=verb, target_post_id=target_post_id, is_read=False,
+    )
+    notification_id = group.values_list('id', flat=True).first()
+    if notification_id is None:
+        try:
+            with transaction.atomic():
+                notification = Notification.objects.create(
+                    recipient_id=recipient_id, verb=verb, target_post_id=target_post_id, last_actor_id=actor_id,
+                )
+                NotificationActor.objects.create(notification=notification, actor_id=actor_id)
+                CustomUser.objects.filter(pk=recipient_id).update(
+                    unread_notifications_count=F('unread_notifications_count') + 1
+                )
+        except IntegrityError:
+            # Another request opened the unread group first; fold into it.
+            notification_id = group.values_list('id', flat=True).first()
+    if notification_id is not None:
+        fold(notification_id, actor_id)
+    publish_notification(recipient_id)
+
+
+def fold(notification_id, actor_id):
+    # The unique (notification, actor) row decides whether this actor is new
+    # to the group, also when the same actor races itself.
+    try:
+        with transaction.atomic():
+            NotificationActor.objects.create(notification_id=notification_id, actor_id=actor_id)
+        actor_count = F('actor_count') + 1
+    except IntegrityError:
+        actor_count = F('actor_count')
+    Notification.objects.filter(pk=notification_id).update(
+        actor_count=actor_count, last_actor_id=actor_id, updated_at=timezone.now(),
+    )
+
+
+def mark_read(recipient, ids=None):
+    unread = Notification.objects.filter(recipient=recipient, is_read=False)
+    if ids is not None:
+        unread = unread.filter(id__in=ids)
+    with transaction.atomic():
+        marked = unread.update(is_read=True)
+        if marked:
+            CustomUser.objects.filter(pk=recipient.pk).update(
+                unread_notifications_count=Greatest(F('unread_notifications_count') - marked, 0)
+            )
+    return marked
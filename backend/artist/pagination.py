@@ -0,0 +1,169 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, position):
+    """Rows after ``position`` in ``ordering``, as a Q."""
+    # (a, b) < (x, y)  ==>  a < x OR (a = x AND b < y), per direction.
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    if len(ordering) > 1:
+        # A redundant a <= x bound lets the database walk one index range
+        # in order instead of merging the OR branches and sorting them.
+        field = ordering[0]
+        lookup = 'lte' if field.startswith('-') else 'gte'
+        condition = Q(**{f'{field.lstrip("-")}__{lookup}': position[0]}) & condition
+    return condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination over a unique ordering.
+
+    The cursor is the base64-encoded position of the last row of the
+    previous page, so every page is a bounded index range scan no matter
+    how deep the client has scrolled.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    # Ordering fields decoded as datetimes; the others are integer ids.
+    datetime_fields = ('created_at', 'timestamp', 'updated_at')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+
+        return self.paginate_results(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+
+        return self.paginate_results([obj async for obj in queryset[:self.page_size + 1]])
+
+    def paginate_results(self, results):
+        # ``results`` holds one row more than a page when there is a next page.
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            position.append(value)
+        return position
+
+    def get_keyset_filter(self, position):
+        return keyset_filter(self.ordering, position)
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            position = json.loads(data)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [self.parse_cursor_value(field, value) for field, value in zip(self.ordering, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_cursor_value(self, field, value):
+        if field.lstrip('-') not in self.datetime_fields:
+            if isinstance(value, bool):
+                raise TypeError(value)
+            return int(value)
+        if not isinstance(value, str):
+            raise TypeError(value)
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+
+class FollowPagination(KeysetPagination):
+    # Follower/following lists are ordered by when the follow happened; the
+    # views annotate the Follow row id as ``follow_id``.
+    ordering = ('-follow_id',)
+
+
+class ActivityPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class NotificationPagination(KeysetPagination):
+    ordering = ('-updated_at', '-id')
+
+
+class SearchPagination(PageNumberPagination):
+    # Search results are ordered by relevance, which has no stable keyset.
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
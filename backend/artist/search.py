@@ -0,0 +1,92 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'artist_post_fts'
+
+# bm25() column weights for (title, description, category).
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def create_index(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        f"USING fts5(title, description, category, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def populate_index(cursor):
+    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, description, category) "
+        f"SELECT id, title, description, category FROM artist_post"
+    )
+    cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def index_post(post):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description, category) VALUES (%s, %s, %s, %s)",
+            [post.pk, post.title, post.description, post.category],
+        )
+
+
+def remove_post(post_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        create_index(cursor)
+        populate_index(cursor)
+
+
+def build_match_query(text):
+    # Quote every term so user input can never be parsed as FTS5 syntax, and
+    # prefix-match the last one so results show up while the user types.
+    tokens = TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_posts(queryset, text):
+    """Restrict ``queryset`` to posts matching ``text``, best match first."""
+    match = build_match_query(text)
+    if match is None:
+        return queryset.none()
+    if not is_available():
+        for token in TOKEN_RE.findall(text):
+            queryset = queryset.filter(
+                Q(title__icontains=token) | Q(description__icontains=token) | Q(category__icontains=token)
+            )
+        return queryset.order_by('-created_at')
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    table = queryset.model._meta.db_table
+    # bm25() only works in the query that runs the MATCH. The ranked
+    # subquery runs that MATCH once; its LIMIT keeps SQLite from flattening
+    # it into a MATCH per post, and the posts then look their rank up by id.
+    matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    rank = RawSQL(
+        f'SELECT ranked.rank FROM (SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s LIMIT -1) AS ranked WHERE ranked.rowid = {table}.id',
+        [match],
+    )
+    return queryset.filter(id__in=matches).annotate(rank=rank).order_by('rank', '-created_at')
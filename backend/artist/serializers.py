@@ -1,20 +1,18 @@
 from rest_framework import serializers
-from .models import Post, SavePost, LikePost, Comment, Follow, CustomUser, UserActivity
+from .models import Post, SavePost, LikePost, Comment, Follow, CustomUser, UserActivity, Notification
+from .images import build_srcset
 
 class UserSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
+    profile_picture_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'bio', 'profile_picture', 'followers_count', 'following_count', 'is_following']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'bio', 'profile_picture', 'profile_picture_srcset', 'followers_count', 'following_count', 'is_following']
+        read_only_fields = ['followers_count', 'following_count']
 
-    def get_followers_count(self, obj):
-        return Follow.objects.filter(following=obj).count()
-
-    def get_following_count(self, obj):
-        return Follow.objects.filter(follower=obj).count()
+    def get_profile_picture_srcset(self, obj):
+        return build_srcset(obj.profile_picture, obj.profile_picture_variants, self.context.get('request'))
 
     def get_is_following(self, obj):
         request = self.context.get('request')
@@ -24,32 +22,50 @@ class UserSerializer(serializers.ModelSerializer):
             return Follow.objects.filter(follower=request.user, following=obj).exists()
         return False
 
+class UserAutocompleteSerializer(serializers.ModelSerializer):
+    avatar = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'username', 'profile_picture', 'avatar']
+
+    def get_avatar(self, obj):
+        srcset = build_srcset(obj.profile_picture, obj.profile_picture_variants, self.context.get('request'))
+        return srcset.get('thumbnail')
+
 class PostSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     is_saved = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'description', 'image', 'price', 'category', 'created_at', 'updated_at', 'user', 'likes_count', 'comments_count', 'is_liked', 'is_saved', 'is_sold']
-        read_only_fields = ['is_sold']
+        fields = ['id', 'title', 'description', 'image', 'image_srcset', 'price', 'category', 'created_at', 'updated_at', 'user', 'likes_count', 'comments_count', 'saves_count', 'is_liked', 'is_saved', 'is_sold']
+        read_only_fields = ['is_sold', 'likes_count', 'comments_count', 'saves_count']
 
-    def get_likes_count(self, obj):
-        return obj.liked_by_users.count()
+    def to_representation(self, instance):
+        # Hand the follow flag annotated by Post.objects.with_engagement()
+        # down to the nested UserSerializer.
+        if hasattr(instance, 'user_is_following'):
+            instance.user.is_following = instance.user_is_following
+        return super().to_representation(instance)
 
-    def get_comments_count(self, obj):
-        return obj.comment_by_users.count()
+    def get_image_srcset(self, obj):
+        return build_srcset(obj.image, obj.image_variants, self.context.get('request'))
 
     def get_is_liked(self, obj):
         request = self.context.get('request')
+        if request and request.user.is_authenticated and hasattr(obj, 'is_liked'):
+            return obj.is_liked
         if request and request.user.is_authenticated:
             return obj.liked_by_users.filter(user=request.user).exists()
         return False
 
     def get_is_saved(self, obj):
         request = self.context.get('request')
+        if request and request.user.is_authenticated and hasattr(obj, 'is_saved'):
+            return obj.is_saved
         if request and request.user.is_authenticated:
             return obj.saved_by_users.filter(user=request.user).exists()
         return False
@@ -98,3 +114,46 @@ class UserActivitySerializer(serializers.ModelSerializer):
     class Meta:
         model = UserActivity
         fields = '__all__'
+
+class ActivityPostSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = ['id', 'title', 'thumbnail']
+
+    def get_thumbnail(self, obj):
+        srcset = build_srcset(obj.image, obj.image_variants, self.context.get('request'))
+        return srcset.get('thumbnail')
+
+class UserActivityCompactSerializer(serializers.ModelSerializer):
+    user = UserAutocompleteSerializer(read_only=True)
+    target_post = ActivityPostSerializer(read_only=True)
+    target_user = UserAutocompleteSerializer(read_only=True)
+
+    class Meta:
+        model = UserActivity
+        fields = ['id', 'action_type', 'description', 'timestamp', 'user', 'target_post', 'target_user']
+
+class NotificationSerializer(serializers.ModelSerializer):
+    last_actor = UserAutocompleteSerializer(read_only=True)
+    target_post = ActivityPostSerializer(read_only=True)
+    message = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'verb', 'message', 'actor_count', 'last_actor', 'target_post', 'is_read', 'created_at', 'updated_at']
+
+    def get_message(self, obj):
+        actor = obj.last_actor.username if obj.last_actor else 'Someone'
+        others = obj.actor_count - 1
+        if others == 1:
+            actor = f"{actor} and 1 other"
+        elif others > 1:
+            actor = f"{actor} and {others} others"
+        if obj.verb == 'follow':
+            return f"{actor} followed you"
+        title = obj.target_post.title if obj.target_post else ''
+        if obj.verb == 'comment':
+            return f"{actor} commented on '{title}'"
+        return f"{actor} {obj.get_verb_display().lower()} '{title}'"
@@ -1,58 +1,120 @@
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Post, Comment, SavePost, UserActivity, LikePost, Follow
+from core.jobs import enqueue
+from .models import Post, Comment, SavePost, LikePost, Follow
+from . import search, tasks, timeline
+from .activity import record_activity
+from .notifications import notify
+from .events import publish_engagement
+from .images import needs_variants
+from .counters import (
+    POST_COUNTERS, increment_post_counter, decrement_post_counter,
+    increment_follow_counters, decrement_follow_counters,
+)
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
+
 @receiver(post_save, sender=Post)
 def create_post_activity(sender, instance, created, **kwargs):
     if created:
-        UserActivity.objects.create(
-            user=instance.user,
-            action_type='post',
-            target_post=instance,
-            description=f"Created post '{instance.title}'"
+        record_activity(
+            instance.user_id,
+            'post',
+            f"Created post '{instance.title}'",
+            target_post_id=instance.pk,
         )
+        enqueue(tasks.fan_out_post, post_id=instance.pk)
 
 @receiver(post_save, sender=Comment)
 def create_comment_activity(sender, instance, created, **kwargs):
     if created:
-        UserActivity.objects.create(
-            user=instance.user,
-            action_type='comment',
-            target_post=instance.post,
-            description=f"Commented: {instance.content[:50]}"
+        record_activity(
+            instance.user_id,
+            'comment',
+            f"Commented: {instance.content[:50]}",
+            target_post_id=instance.post_id,
         )
+        notify(instance.post.user_id, 'comment', instance.user_id, instance.post_id)
 
 @receiver(post_save, sender=LikePost)
 def create_like_activity(sender, instance, created, **kwargs):
     if created:
-        UserActivity.objects.create(
-            user=instance.user,
-            action_type='like',
-            target_post=instance.post,
-            description=f"Liked post '{instance.post.title}'"
+        record_activity(
+            instance.user_id,
+            'like',
+            f"Liked post '{instance.post.title}'",
+            target_post_id=instance.post_id,
         )
+        notify(instance.post.user_id, 'like', instance.user_id, instance.post_id)
 
 @receiver(post_save, sender=SavePost)
 def create_savepost_activity(sender, instance, created, **kwargs):
     if created:
-        UserActivity.objects.create(
-            user=instance.user,
-            action_type='save',
-            target_post=instance.post,
-            description=f"Saved post '{instance.post.title}'"
+        record_activity(
+            instance.user_id,
+            'save',
+            f"Saved post '{instance.post.title}'",
+            target_post_id=instance.post_id,
         )
+        notify(instance.post.user_id, 'save', instance.user_id, instance.post_id)
+
+@receiver(post_save, sender=Follow)
+def create_follow_activity(sender, instance, created, **kwargs):
+    if created:
+        record_activity(
+            instance.follower_id,
+            'follow',
+            f"Followed user {instance.following.username}",
+            target_user_id=instance.following_id,
+        )
+        notify(instance.following_id, 'follow', instance.follower_id)
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        enqueue(tasks.backfill_timeline, follower_id=instance.follower_id, following_id=instance.following_id)
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.trim(instance.follower, instance.following)
+
+@receiver(post_save, sender=Follow)
+def update_follow_counters_on_save(sender, instance, created, **kwargs):
+    if created:
+        increment_follow_counters(instance.follower_id, instance.following_id)
+
+@receiver(post_delete, sender=Follow)
+def update_follow_counters_on_delete(sender, instance, **kwargs):
+    decrement_follow_counters(instance.follower_id, instance.following_id)
+
+def update_post_counter_on_save(sender, instance, created, **kwargs):
+    if created:
+        increment_post_counter(sender, instance.post_id)
+        publish_engagement(instance.post_id)
+
+def update_post_counter_on_delete(sender, instance, **kwargs):
+    decrement_post_counter(sender, instance.post_id)
+    publish_engagement(instance.post_id)
+
+for model in POST_COUNTERS:
+    post_save.connect(update_post_counter_on_save, sender=model, dispatch_uid=f'{model.__name__}_post_counter_save')
+    post_delete.connect(update_post_counter_on_delete, sender=model, dispatch_uid=f'{model.__name__}_post_counter_delete')
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+@receiver(post_save, sender=Post)
+def create_post_image_variants(sender, instance, **kwargs):
+    if needs_variants(instance.image, instance.image_variants):
+        enqueue(tasks.refresh_post_image_variants, post_id=instance.pk)
 
-@receiver(m2m_changed, sender=Follow)
-def create_follow_activity(sender, instance, action, pk_set, **kwargs):
-    if action == 'post_add':
-        from .models import UserActivity
-        for follower_pk in pk_set:
-            follower = User.objects.get(pk=follower_pk)
-            UserActivity.objects.create(
-                user=follower,
-                action_type='follow',
-                target_user=instance,
-                description=f"Followed user {instance.username}"
-            )
\ No newline at end of file
+@receiver(post_save, sender=User)
+def create_profile_picture_variants(sender, instance, **kwargs):
+    if needs_variants(instance.profile_picture, instance.profile_picture_variants):
+        enqueue(tasks.refresh_profile_picture_variants, user_id=instance.pk)
@@ -0,0 +1,30 @@
+from . import timeline
+from .images import refresh_variants
+from .models import CustomUser, Follow, Post
+
+
+def refresh_post_image_variants(post_id):
+    post = Post.objects.filter(pk=post_id).only('pk', 'image', 'image_variants').first()
+    if post:
+        refresh_variants(post, 'image', 'image_variants')
+
+
+def refresh_profile_picture_variants(user_id):
+    user = CustomUser.objects.filter(pk=user_id).only('pk', 'profile_picture', 'profile_picture_variants').first()
+    if user:
+        refresh_variants(user, 'profile_picture', 'profile_picture_variants')
+
+
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).select_related('user').first()
+    if post:
+        timeline.fan_out_post(post)
+
+
+def backfill_timeline(follower_id, following_id):
+    # The follow may have been undone before the job ran.
+    follow = Follow.objects.filter(follower_id=follower_id, following_id=following_id).select_related(
+        'follower', 'following'
+    ).first()
+    if follow:
+        timeline.backfill(follow.follower, follow.following)
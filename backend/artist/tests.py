@@ -1,3 +1,1005 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from core import jobs
+from core.events import LocalBroker
+from core.models import Job
+from core.testing import create_access_token
+from ecommerce.models import Order
+
+from .activity import ActivityRecorder
+from .events import post_channel, publish_engagement
+from .images import variant_names
+from .management.commands.archive_activity import ARCHIVE_FIELDS
+from .models import (
+    Comment, CustomUser, Follow, LikePost, Notification, Post, SavePost, TimelineEntry, UserActivity,
+    UserActivityDailySummary,
+)
+from .pagination import KeysetPagination
+from .timeline import TimelinePagination, pulled_posts, timeline_entries
+from .views import (
+    CommentListCreateView, FollowingFeedView, NotificationListView, PostListCreateView,
+    PostSearchView, UserActivityView, UserFollowersView, UserFollowingView, UserPostsView,
+)
+
+# A plain "SCAN <table>" reads the whole table, and a temp B-tree means the
+# rows are sorted after being read instead of coming out of an index in
+# order. Either one means an index stopped serving the query.
+FULL_SCAN = re.compile(r'\bSCAN (\S+)$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite.')
+class QueryPlanTests(TestCase):
+    """EXPLAIN QUERY PLAN regression tests for the queries behind the hot views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.author = CustomUser.objects.create_user(username='author', password='x')
+        Follow.objects.create(follower=cls.viewer, following=cls.author)
+        Follow.objects.create(follower=cls.author, following=cls.viewer)
+        cls.post = Post.objects.create(user=cls.author, title='Still life', description='Oil', category='painting')
+        # The comment also notifies the author through artist.signals.
+        Comment.objects.create(post=cls.post, user=cls.viewer, content='Lovely')
+        UserActivity.objects.create(user=cls.author, action_type='post', target_post=cls.post)
+
+    def get_view(self, view_class, path='/', user=None, **kwargs):
+        view = view_class()
+        view.format_kwarg = None
+        view.kwargs = kwargs
+        view.request = view.initialize_request(APIRequestFactory().get(path))
+        view.request.user = user or self.viewer
+        return view
+
+    def page_queryset(self, view_class, path='/', user=None, cursor=False, **kwargs):
+        """The queryset a view's paginator runs for the first page, or the next one with ``cursor``."""
+        view = self.get_view(view_class, path, user, **kwargs)
+        paginator = view.pagination_class()
+        queryset = view.get_queryset()
+        if hasattr(paginator, 'ordering'):
+            queryset = queryset.order_by(*paginator.ordering)
+        if cursor:
+            last = queryset.first()
+            self.assertIsNotNone(last, 'The fixture needs a row to build a cursor from.')
+            queryset = queryset.filter(paginator.get_keyset_filter(paginator.get_position(last)))
+        return queryset[:paginator.page_size + 1]
+
+    def assertIndexedPlan(self, queryset):
+        plan = [line.split(maxsplit=3)[-1] for line in queryset.explain().splitlines()]
+        for detail in plan:
+            self.assertIsNone(FULL_SCAN.search(detail), 'Full table scan in plan:\n' + '\n'.join(plan))
+            self.assertIsNone(TEMP_SORT.search(detail), 'Sort not served by an index:\n' + '\n'.join(plan))
+
+    def test_post_list(self):
+        self.assertIndexedPlan(self.page_queryset(PostListCreateView))
+        self.assertIndexedPlan(self.page_queryset(PostListCreateView, cursor=True))
+
+    def test_user_posts(self):
+        self.assertIndexedPlan(self.page_queryset(UserPostsView, username='author'))
+        self.assertIndexedPlan(self.page_queryset(UserPostsView, username='author', cursor=True))
+
+    def test_post_search_by_category(self):
+        view = self.get_view(PostSearchView, '/?category=painting&is_sold=false')
+        self.assertIndexedPlan(view.get_queryset()[:view.pagination_class.page_size])
+
+    def test_post_comments(self):
+        view = self.get_view(CommentListCreateView, f'/?post_id={self.post.pk}')
+        self.assertIndexedPlan(view.get_queryset()[:20])
+
+    def test_user_activity(self):
+        self.assertIndexedPlan(self.page_queryset(UserActivityView, username='author'))
+        self.assertIndexedPlan(self.page_queryset(UserActivityView, username='author', cursor=True))
+
+    def test_followers_and_following(self):
+        for view_class in (UserFollowersView, UserFollowingView):
+            with self.subTest(view=view_class.__name__):
+                self.assertIndexedPlan(self.page_queryset(view_class, username='author'))
+                self.assertIndexedPlan(self.page_queryset(view_class, username='author', cursor=True))
+
+    def test_following_feed(self):
+        # Every source of a feed page is one index range; see
+        # artist.timeline.get_timeline_page.
+        limit = TimelinePagination.page_size + 1
+        position = [self.post.created_at.isoformat(), self.post.pk]
+        self.assertIndexedPlan(timeline_entries(self.viewer)[:limit])
+        self.assertIndexedPlan(timeline_entries(self.viewer, position)[:limit])
+        self.assertIndexedPlan(pulled_posts(self.author.pk)[:limit])
+        self.assertIndexedPlan(pulled_posts(self.author.pk, position)[:limit])
+        view = self.get_view(FollowingFeedView)
+        self.assertIndexedPlan(view.get_queryset().filter(pk__in=[self.post.pk]))
+
+    def test_notifications(self):
+        self.assertIndexedPlan(self.page_queryset(NotificationListView, user=self.author))
+        self.assertIndexedPlan(self.page_queryset(NotificationListView, user=self.author, cursor=True))
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True, QUERY_BUDGETS_ENFORCED=True)
+class QueryBudgetTests(TestCase):
+    """
+    Requests over their QUERY_BUDGETS entry raise QueryBudgetExceeded, so an
+    N+1 in a serializer fails these tests instead of shipping.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        authors = [CustomUser.objects.create_user(username=f'author{i}', password='x') for i in range(3)]
+        cls.author = authors[0]
+        for author in authors:
+            Follow.objects.create(follower=cls.viewer, following=author)
+            Follow.objects.create(follower=author, following=cls.viewer)
+        # More rows than a page, spread over several authors, so per-row
+        # lookups would show up as extra queries.
+        for i in range(25):
+            post = Post.objects.create(user=authors[i % 3], title=f'Study {i}', description='Ink')
+            LikePost.objects.create(post=post, user=cls.viewer)
+            Comment.objects.create(post=post, user=authors[(i + 1) % 3], content='Nice')
+            UserActivity.objects.create(user=cls.author, action_type='like', target_post=post, target_user=authors[i % 3])
+        create_access_token(cls.viewer, 'budget-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer budget-token'
+
+    def test_read_endpoints_stay_within_budget(self):
+        for path in (
+            '/api/posts/',
+            '/api/feed/',
+            '/api/users/author0/',
+            '/api/users/author0/posts/',
+            '/api/users/author0/followers/',
+            '/api/users/author0/following/',
+            '/api/user-activity/author0/',
+            '/api/notifications/',
+        ):
+            with self.subTest(path=path), self.assertLogs('core.instrumentation', 'INFO') as logs:
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Server-Timing', response)
+                self.assertEqual(json.loads(logs.records[0].getMessage())['path'], path)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.posts = [Post.objects.create(user=cls.viewer, title=f'Study {i}') for i in range(5)]
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+
+    def read_all(self, url):
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen += [post['id'] for post in page['results']]
+            url = page['next']
+        return seen
+
+    def test_pages_cover_every_post_once(self):
+        self.assertEqual(self.read_all('/api/posts/?page_size=2'), [post.pk for post in reversed(self.posts)])
+
+    def test_tied_timestamps_are_ordered_by_id(self):
+        Post.objects.update(created_at=timezone.now())
+        self.assertEqual(self.read_all('/api/posts/?page_size=2'), [post.pk for post in reversed(self.posts)])
+
+    def test_tampered_cursor_is_not_found(self):
+        encode = KeysetPagination().encode_cursor
+        for position in (
+            ['garbage', 1], [{'a': 1}, 2], [None, None], [1, 2], ['2020-01-01T00:00:00', 'x'], [True, 1],
+        ):
+            cursor = encode(position)
+            for path in ('/api/posts/', '/api/async/posts/', '/api/feed/', '/api/user-activity/viewer/'):
+                with self.subTest(position=position, path=path):
+                    self.assertEqual(self.client.get(path, {'cursor': cursor}).status_code, 404)
+
+
+class PageQueryCountTests(TestCase):
+    """A list page costs the same number of queries however many rows it holds."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.author = CustomUser.objects.create_user(username='author', password='x')
+        for i in range(12):
+            member = CustomUser.objects.create_user(username=f'member{i}', password='x')
+            Follow.objects.create(follower=member, following=cls.author)
+            Follow.objects.create(follower=cls.author, following=member)
+            if i % 2:
+                Follow.objects.create(follower=cls.viewer, following=member)
+            for user in (member, cls.author):
+                post = Post.objects.create(user=user, title=f'Study {i}')
+                LikePost.objects.create(post=post, user=cls.viewer)
+                SavePost.objects.create(post=post, user=cls.viewer)
+                Comment.objects.create(post=post, user=member, content='Nice')
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+
+    def get_page(self, path, page_size):
+        response = self.client.get(path, {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        for path in (
+            '/api/posts/',
+            '/api/users/author/posts/',
+            '/api/users/author/followers/',
+            '/api/users/author/following/',
+        ):
+            with self.subTest(path=path):
+                # Warm the bearer token cache so both pages authenticate alike.
+                self.get_page(path, 1)
+                with CaptureQueriesContext(connection) as small:
+                    self.get_page(path, 2)
+                with self.assertNumQueries(len(small)):
+                    self.get_page(path, 10)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Post search uses SQLite FTS5.')
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.in_title = Post.objects.create(user=cls.viewer, title='Harbour at dusk', description='Oil', price=300,
+                                           category='painting')
+        cls.in_description = Post.objects.create(user=cls.viewer, title='Study', description='A harbour sketch',
+                                                 price=50, category='drawing')
+        cls.unrelated = Post.objects.create(user=cls.viewer, title='Dunes', description='Ink', price=80,
+                                            category='drawing')
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+
+    def search(self, **params):
+        response = self.client.get('/api/posts/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.json()['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search(q='harbour'), [self.in_title.pk, self.in_description.pk])
+
+    def test_last_term_is_a_prefix(self):
+        self.assertEqual(self.search(q='harb'), [self.in_title.pk, self.in_description.pk])
+
+    def test_filters_combine_with_the_query(self):
+        self.assertEqual(self.search(q='harbour', category='drawing'), [self.in_description.pk])
+        self.assertEqual(self.search(q='harbour', max_price='100'), [self.in_description.pk])
+        self.assertEqual(self.search(min_price='60', max_price='100'), [self.unrelated.pk])
+        Post.objects.filter(pk=self.in_title.pk).update(is_sold=True)
+        self.assertEqual(self.search(q='harbour', is_sold='false'), [self.in_description.pk])
+
+    def test_invalid_prices_are_rejected(self):
+        for value in ('abc', 'NaN', 'Infinity', '-Infinity'):
+            with self.subTest(value=value):
+                response = self.client.get('/api/posts/search/', {'min_price': value})
+                self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_post_changes(self):
+        self.unrelated.title = 'Harbour lights'
+        self.unrelated.save()
+        self.assertIn(self.unrelated.pk, self.search(q='lights'))
+        self.assertEqual(self.search(q='dunes'), [])
+        self.in_title.delete()
+        self.assertEqual(self.search(q='harbour'), [self.unrelated.pk, self.in_description.pk])
+
+
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        create_access_token(cls.artist, 'artist-token')
+
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=media_root, JOB_QUEUE_EAGER=True))
+
+    def upload(self, name, size):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 80, 40, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def open_variant(self, name):
+        return Image.open(default_storage.open(name))
+
+    def test_upload_generates_every_size_and_format(self):
+        post = Post.objects.create(user=self.artist, title='Dunes', image=self.upload('dunes.png', (2000, 1000)))
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants['source'], post.image.name)
+        expected = {'thumbnail': (320, 160), 'medium': (800, 400), 'large': (1600, 800)}
+        for size, dimensions in expected.items():
+            for key, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with self.subTest(size=size, format=key), self.open_variant(post.image_variants[size][key]) as image:
+                    self.assertEqual((image.format, image.size), (image_format, dimensions))
+
+    def test_small_images_are_not_upscaled(self):
+        post = Post.objects.create(user=self.artist, title='Stamp', image=self.upload('stamp.png', (100, 50)))
+        post.refresh_from_db()
+        with self.open_variant(post.image_variants['large']['jpeg']) as image:
+            self.assertEqual(image.size, (100, 50))
+
+    def test_replacing_the_image_deletes_the_old_variants(self):
+        post = Post.objects.create(user=self.artist, title='Dunes', image=self.upload('dunes.png', (400, 400)))
+        post.refresh_from_db()
+        old_names = variant_names(post.image_variants)
+        post.image = self.upload('harbour.png', (400, 400))
+        post.save()
+        post.refresh_from_db()
+        self.assertIn('harbour', post.image_variants['source'])
+        self.assertFalse(any(default_storage.exists(name) for name in old_names))
+        self.assertTrue(all(default_storage.exists(name) for name in variant_names(post.image_variants)))
+
+    def test_srcset_in_the_post_payload(self):
+        post = Post.objects.create(user=self.artist, title='Dunes', image=self.upload('dunes.png', (400, 400)))
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer artist-token'
+        srcset = self.client.get(f'/api/posts/{post.pk}/').json()['image_srcset']
+        self.assertEqual(set(srcset), {'thumbnail', 'medium', 'large'})
+        self.assertTrue(srcset['thumbnail']['webp'].startswith('http://testserver/media/posts/dunes'))
+
+    def test_generate_image_variants_command(self):
+        with self.settings(JOB_QUEUE_EAGER=False):
+            post = Post.objects.create(user=self.artist, title='Dunes', image=self.upload('dunes.png', (400, 400)))
+        self.assertEqual(Post.objects.get(pk=post.pk).image_variants, {})
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertEqual(Post.objects.get(pk=post.pk).image_variants['source'], post.image.name)
+        self.assertIn('Post: generated variants for 1 images, 0 failed.', out.getvalue())
+
+
+class FollowListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.author = CustomUser.objects.create_user(username='author', password='x')
+        cls.members = [CustomUser.objects.create_user(username=f'member{i}', password='x') for i in range(3)]
+        for member in cls.members:
+            Follow.objects.create(follower=member, following=cls.author)
+        Follow.objects.create(follower=cls.author, following=cls.members[0])
+        Follow.objects.create(follower=cls.viewer, following=cls.members[1])
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+
+    def read_all(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [(user['username'], user['is_following']) for user in response.json()['results']]
+            url = response.json()['next']
+        return seen
+
+    def test_followers_newest_first_with_the_viewers_follow_state(self):
+        self.assertEqual(self.read_all('/api/users/author/followers/?page_size=2'), [
+            ('member2', False), ('member1', True), ('member0', False),
+        ])
+
+    def test_following(self):
+        self.assertEqual(self.read_all('/api/users/author/following/'), [('member0', False)])
+        self.assertEqual(self.read_all('/api/users/me/following/'), [('member1', True)])
+
+    def test_unknown_user(self):
+        self.assertEqual(self.client.get('/api/users/nobody/followers/').status_code, 404)
+
+
+class UserAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.john = CustomUser.objects.create_user(username='jsmith', password='x', first_name='John', last_name='Smith')
+        cls.zoe = CustomUser.objects.create_user(username='zo', password='x', first_name='Zoë', last_name='Ångström')
+        cls.smidge = CustomUser.objects.create_user(username='smidge', password='x')
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+
+    def autocomplete(self, query):
+        response = self.client.get('/api/users/search/', {'query': query, 'mode': 'autocomplete'})
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.json()]
+
+    def test_username_then_name_matches(self):
+        self.assertEqual(self.autocomplete('smi'), ['smidge', 'jsmith'])
+        self.assertEqual(self.autocomplete('john sm'), ['jsmith'])
+
+    def test_last_name_prefix(self):
+        self.assertEqual(self.autocomplete('smit'), ['jsmith'])
+        john = CustomUser.objects.get(pk=self.john.pk)
+        john.last_name = 'Carter'
+        john.save(update_fields=['last_name'])
+        self.assertEqual(self.autocomplete('smit'), [])
+        self.assertEqual(self.autocomplete('cart'), ['jsmith'])
+
+    def test_accents_and_case_are_ignored(self):
+        for query in ('zoe', 'ZOË', 'angst', 'ÅNGSTRÖM', 'zoe ang'):
+            with self.subTest(query=query):
+                self.assertEqual(self.autocomplete(query), ['zo'])
+
+    def test_empty_prefix_matches_nobody(self):
+        for query in ('', '   ', '\u0301'):
+            with self.subTest(query=query):
+                self.assertEqual(self.autocomplete(query), [])
+
+    def test_excludes_the_viewer(self):
+        self.assertEqual(self.autocomplete('view'), [])
+
+
+class TokenCacheTests(TestCase):
+    """Cached bearer tokens must not serve a stale copy of their user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        create_access_token(cls.author, 'author-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer author-token'
+
+    def test_counters_are_fresh_after_a_cached_lookup(self):
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').json()['unread_count'], 0)
+        self.assertEqual(self.client.get('/api/me/').json()['followers_count'], 0)
+
+        # Counters are maintained with queryset.update(), which sends no signals.
+        Follow.objects.create(follower=self.fan, following=self.author)
+
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').json()['unread_count'], 1)
+        self.assertEqual(self.client.get('/api/me/').json()['followers_count'], 1)
+
+    def test_cached_token_loads_the_user_once(self):
+        self.client.get('/api/me/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/me/').status_code, 200)
+        user_queries = [query['sql'] for query in queries if 'FROM "artist_customuser"' in query['sql']]
+        self.assertEqual(len(user_queries), 1, user_queries)
+        self.assertFalse([query['sql'] for query in queries if 'oauth2_provider_accesstoken' in query['sql']])
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/me/').status_code, 200)
+        CustomUser.objects.filter(pk=self.author.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=1, TIMELINE_BACKFILL_SIZE=3, TIMELINE_MAX_ENTRIES=5, JOB_QUEUE_EAGER=True)
+class TimelineTests(TestCase):
+    """Fan-out on write for most authors, pull on read above TIMELINE_FANOUT_LIMIT."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        cls.author = CustomUser.objects.create_user(username='author', password='x')
+        cls.celebrity = CustomUser.objects.create_user(username='celebrity', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        Follow.objects.create(follower=cls.viewer, following=cls.author)
+        Follow.objects.create(follower=cls.viewer, following=cls.celebrity)
+        Follow.objects.create(follower=cls.fan, following=cls.celebrity)
+        # Counters are updated in the database only.
+        cls.author.refresh_from_db()
+        cls.celebrity.refresh_from_db()
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def timeline(self, user):
+        return list(
+            TimelineEntry.objects.filter(user=user).order_by('-created_at', '-post_id').values_list('post_id', flat=True)
+        )
+
+    def create_posts(self, user, count):
+        return [Post.objects.create(user=user, title=f'{user.username} {i}') for i in range(count)]
+
+    def test_posts_fan_out_to_followers(self):
+        post, = self.create_posts(self.author, 1)
+        self.assertEqual(self.timeline(self.viewer), [post.pk])
+        self.assertEqual(self.timeline(self.fan), [])
+
+    @override_settings(JOB_QUEUE_EAGER=False, TIMELINE_FANOUT_LIMIT=2)
+    def test_fan_out_and_backfill_run_in_jobs(self):
+        post, = self.create_posts(self.author, 1)
+        Follow.objects.create(follower=self.fan, following=self.author)
+        self.assertEqual(self.timeline(self.viewer), [])
+        self.assertEqual(self.timeline(self.fan), [])
+        self.assertCountEqual(
+            Job.objects.values_list('task', flat=True),
+            ['artist.tasks.fan_out_post', 'artist.tasks.backfill_timeline'],
+        )
+        for job in jobs.claim_jobs(10):
+            self.assertTrue(jobs.run_job(job))
+        self.assertEqual(self.timeline(self.viewer), [post.pk])
+        self.assertEqual(self.timeline(self.fan), [post.pk])
+
+    def test_backfill_skips_an_undone_follow(self):
+        self.create_posts(self.author, 1)
+        with override_settings(JOB_QUEUE_EAGER=False):
+            Follow.objects.create(follower=self.fan, following=self.author)
+        Follow.objects.get(follower=self.fan, following=self.author).delete()
+        for job in jobs.claim_jobs(10):
+            jobs.run_job(job)
+        self.assertEqual(self.timeline(self.fan), [])
+
+    def test_authors_over_the_limit_are_not_fanned_out(self):
+        self.create_posts(self.celebrity, 2)
+        self.assertEqual(self.timeline(self.viewer), [])
+        self.assertEqual(self.timeline(self.fan), [])
+
+    def test_follow_backfills_recent_posts(self):
+        posts = self.create_posts(self.author, 4)
+        Follow.objects.create(follower=self.fan, following=self.author)
+        self.assertEqual(self.timeline(self.fan), [post.pk for post in reversed(posts[1:])])
+
+    def test_unfollow_trims_the_authors_posts(self):
+        self.create_posts(self.author, 2)
+        Follow.objects.get(follower=self.viewer, following=self.author).delete()
+        self.assertEqual(self.timeline(self.viewer), [])
+
+    def test_timeline_is_capped(self):
+        posts = self.create_posts(self.author, 7)
+        self.assertEqual(self.timeline(self.viewer), [post.pk for post in reversed(posts[2:])])
+
+    def test_feed_merges_pulled_authors_in_order(self):
+        posts = []
+        for i in range(3):
+            posts += self.create_posts(self.author, 1) + self.create_posts(self.celebrity, 1)
+        # A post by an author who has since crossed the limit is in both sources.
+        TimelineEntry.objects.create(user=self.viewer, post=posts[1], created_at=posts[1].created_at)
+
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+        seen = []
+        url = '/api/feed/?page_size=4'
+        while url:
+            page = self.client.get(url).json()
+            seen += [post['id'] for post in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [post.pk for post in reversed(posts)])
+
+
+class ActivityRecorderTests(TransactionTestCase):
+    """
+    Runs in real transactions: foreign keys are checked when a transaction
+    commits, which is where a flushed batch with a dangling row fails.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(ActivityRecorder, 'start_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recorder = ActivityRecorder()
+        self.user = CustomUser.objects.create_user(username='viewer', password='x')
+        self.posts = [Post.objects.create(user=self.user, title=f'Study {i}') for i in range(6)]
+        UserActivity.objects.all().delete()
+
+    def record_likes(self):
+        for post in self.posts:
+            self.recorder.record(user_id=self.user.pk, action_type='like', target_post_id=post.pk)
+
+    @override_settings(ACTIVITY_BUFFERING=False)
+    def test_unbuffered_events_are_written_immediately(self):
+        self.record_likes()
+        self.assertEqual(self.recorder.buffer, [])
+        self.assertEqual(UserActivity.objects.count(), 6)
+
+    @override_settings(ACTIVITY_BUFFERING=True)
+    def test_buffered_events_are_written_on_flush(self):
+        with transaction.atomic():
+            self.record_likes()
+            self.assertEqual(self.recorder.buffer, [])
+        self.assertEqual(UserActivity.objects.count(), 0)
+        self.assertEqual(self.recorder.flush(), 6)
+        self.assertEqual(UserActivity.objects.count(), 6)
+
+    @override_settings(ACTIVITY_BUFFERING=True)
+    def test_rolled_back_events_are_discarded(self):
+        with transaction.atomic():
+            self.record_likes()
+            transaction.set_rollback(True)
+        self.assertEqual(self.recorder.buffer, [])
+
+    @override_settings(ACTIVITY_BUFFERING=True)
+    def test_a_dangling_row_only_drops_itself(self):
+        self.record_likes()
+        Post.objects.filter(pk=self.posts[2].pk).delete()
+        with self.assertLogs('artist.activity', 'WARNING') as logs:
+            self.assertEqual(self.recorder.flush(), 5)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(UserActivity.objects.count(), 5)
+
+    @override_settings(ACTIVITY_BUFFERING=True)
+    def test_locked_database_keeps_the_batch(self):
+        self.record_likes()
+        locked = OperationalError('database is locked')
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=locked), \
+                self.assertLogs('artist.activity', 'WARNING'):
+            self.assertEqual(self.recorder.flush(), 0)
+        self.assertEqual(len(self.recorder.buffer), 6)
+        self.assertEqual(self.recorder.flush(), 6)
+        self.assertEqual(UserActivity.objects.count(), 6)
+
+    @override_settings(ACTIVITY_BUFFERING=True, ACTIVITY_BUFFER_LIMIT=4)
+    def test_requeued_events_are_bounded(self):
+        self.record_likes()
+        locked = OperationalError('database is locked')
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=locked), \
+                self.assertLogs('artist.activity', 'WARNING') as logs:
+            self.recorder.flush()
+        self.assertIn('Dropped 2 buffered activity events', logs.output[-1])
+        self.assertEqual([event.target_post_id for event in self.recorder.buffer], [post.pk for post in self.posts[2:]])
+
+
+@override_settings(ACTIVITY_BUFFER_SIZE=3, ACTIVITY_FLUSH_INTERVAL=60)
+class ActivityFlusherTests(TransactionTestCase):
+    """The recorder's own flusher thread, writing through its own connection."""
+
+    def setUp(self):
+        self.recorder = ActivityRecorder()
+        self.user = CustomUser.objects.create_user(username='viewer', password='x')
+        self.post = Post.objects.create(user=self.user, title='Study')
+        UserActivity.objects.all().delete()
+
+    def record_likes(self, count):
+        # Only these events are buffered; the fixtures' go straight in.
+        with self.settings(ACTIVITY_BUFFERING=True):
+            for _ in range(count):
+                self.recorder.record(user_id=self.user.pk, action_type='like', target_post_id=self.post.pk)
+
+    def wait_until(self, condition, message, timeout=5):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if condition():
+                    return
+            except OperationalError:
+                # The in-memory test database locks a table while the
+                # flusher writes to it.
+                pass
+            if time.monotonic() > deadline:
+                self.fail(f'{message} after {timeout}s')
+            time.sleep(0.01)
+
+    def wait_for_rows(self, count):
+        self.wait_until(lambda: UserActivity.objects.count() == count, f'No {count} activity rows')
+
+    def test_full_buffer_is_flushed_at_once(self):
+        self.record_likes(2)
+        time.sleep(0.2)
+        self.assertEqual(UserActivity.objects.count(), 0)
+        self.record_likes(1)
+        self.wait_for_rows(3)
+
+    @override_settings(ACTIVITY_FLUSH_INTERVAL=0.05)
+    def test_buffer_is_flushed_every_interval(self):
+        self.record_likes(2)
+        self.wait_for_rows(2)
+
+    @override_settings(ACTIVITY_FLUSH_INTERVAL=0.05)
+    def test_refused_writes_are_retried(self):
+        locked = OperationalError('database is locked')
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=locked), \
+                self.assertLogs('artist.activity', 'WARNING') as logs:
+            self.record_likes(2)
+            self.wait_until(lambda: logs.records, 'No refused flush')
+            self.assertEqual(UserActivity.objects.count(), 0)
+        self.wait_for_rows(2)
+
+
+class PostCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        cls.post = Post.objects.create(user=cls.artist, title='Dunes')
+
+    def counters(self):
+        post = Post.objects.get(pk=self.post.pk)
+        return post.likes_count, post.comments_count, post.saves_count
+
+    def test_engagement_moves_the_counters(self):
+        like = LikePost.objects.create(post=self.post, user=self.fan)
+        save = SavePost.objects.create(post=self.post, user=self.fan)
+        comment = Comment.objects.create(post=self.post, user=self.fan, content='Nice')
+        self.assertEqual(self.counters(), (1, 1, 1))
+        like.delete()
+        save.delete()
+        comment.delete()
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_counters_do_not_go_below_zero(self):
+        like = LikePost.objects.create(post=self.post, user=self.fan)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=0)
+        like.delete()
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_save_leaves_the_counters_alone(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        LikePost.objects.create(post=self.post, user=self.fan)
+        stale.title = 'Dunes at noon'
+        stale.likes_count = 40
+        stale.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.title, post.likes_count), ('Dunes at noon', 1))
+
+    def test_reconcile_counters_repairs_drift(self):
+        LikePost.objects.create(post=self.post, user=self.fan)
+        Comment.objects.create(post=self.post, user=self.fan, content='Nice')
+        untouched = Post.objects.create(user=self.artist, title='Harbour')
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, comments_count=0, saves_count=2)
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        self.assertEqual(self.counters(), (1, 1, 0))
+        self.assertEqual(Post.objects.get(pk=untouched.pk).likes_count, 0)
+        self.assertIn('Checked 2 posts, fixed 1.', out.getvalue())
+
+
+class UserCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        create_access_token(cls.fan, 'fan-token')
+
+    def counters(self, user):
+        user = CustomUser.objects.get(pk=user.pk)
+        return user.followers_count, user.following_count, user.unread_notifications_count
+
+    def test_follow_and_unfollow_move_the_counters(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer fan-token'
+        response = self.client.post('/api/follows/toggle/', {'username': 'artist'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counters(self.artist), (1, 0, 1))
+        self.assertEqual(self.counters(self.fan), (0, 1, 0))
+        response = self.client.post('/api/follows/toggle/', {'username': 'artist'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(self.artist)[:2], (0, 0))
+        self.assertEqual(self.counters(self.fan), (0, 0, 0))
+
+    def test_save_leaves_the_counters_alone(self):
+        stale = CustomUser.objects.get(pk=self.artist.pk)
+        Follow.objects.create(follower=self.fan, following=self.artist)
+        stale.bio = 'Painter'
+        stale.followers_count = 40
+        stale.save()
+        self.assertEqual(CustomUser.objects.get(pk=self.artist.pk).bio, 'Painter')
+        self.assertEqual(self.counters(self.artist), (1, 0, 1))
+
+    def test_reconcile_counters_repairs_drift(self):
+        Follow.objects.create(follower=self.fan, following=self.artist)
+        CustomUser.objects.filter(pk=self.artist.pk).update(followers_count=5, unread_notifications_count=0)
+        CustomUser.objects.filter(pk=self.fan.pk).update(following_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEqual(self.counters(self.artist), (1, 0, 1))
+        self.assertEqual(self.counters(self.fan), (0, 1, 0))
+        self.assertIn('Checked 2 users, fixed 2.', out.getvalue())
+
+
+class ActivityPayloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        cls.post = Post.objects.create(user=cls.artist, title='Dunes')
+        UserActivity.objects.all().delete()
+        cls.like = UserActivity.objects.create(
+            user=cls.fan, action_type='like', description="Liked post 'Dunes'", target_post=cls.post,
+        )
+        cls.follow = UserActivity.objects.create(
+            user=cls.fan, action_type='follow', description='Followed user artist', target_user=cls.artist,
+        )
+        create_access_token(cls.artist, 'artist-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer artist-token'
+
+    def test_compact_rows(self):
+        follow, like = self.client.get('/api/user-activity/fan/').json()['results']
+        self.assertEqual(set(like), {'id', 'action_type', 'description', 'timestamp', 'user', 'target_post', 'target_user'})
+        self.assertEqual(like['user'], {'id': self.fan.pk, 'username': 'fan', 'profile_picture': None, 'avatar': None})
+        self.assertEqual(like['target_post'], {'id': self.post.pk, 'title': 'Dunes', 'thumbnail': None})
+        self.assertIsNone(like['target_user'])
+        self.assertEqual((follow['id'], follow['target_user']['username']), (self.follow.pk, 'artist'))
+
+    def test_expand_full(self):
+        follow, like = self.client.get('/api/user-activity/fan/', {'expand': 'full'}).json()['results']
+        self.assertEqual(like['target_post']['likes_count'], 0)
+        self.assertEqual(follow['target_user']['followers_count'], 0)
+
+    def test_compact_page_is_a_single_query(self):
+        UserActivity.objects.bulk_create(
+            UserActivity(user=self.fan, action_type='like', target_post=self.post) for _ in range(10)
+        )
+        self.client.get('/api/user-activity/fan/')
+        # The token's user, the profile lookup and the page itself.
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/user-activity/fan/')
+        self.assertEqual(len(response.json()['results']), 12)
+
+
+class ArchiveActivityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        cls.day = timezone.now() - timedelta(days=200)
+        cls.old = [
+            UserActivity.objects.create(user=cls.fan, action_type='like', timestamp=cls.day),
+            UserActivity.objects.create(user=cls.fan, action_type='like', timestamp=cls.day + timedelta(minutes=1)),
+            UserActivity.objects.create(user=cls.fan, action_type='follow', timestamp=cls.day, target_user=cls.artist),
+            UserActivity.objects.create(user=cls.artist, action_type='post', timestamp=cls.day),
+        ]
+        cls.recent = UserActivity.objects.create(user=cls.fan, action_type='like')
+        UserActivityDailySummary.objects.create(
+            user=cls.fan, action_type='like', date=timezone.localdate(cls.day), count=3,
+        )
+
+    def archive(self, *args):
+        archive_dir = self.enterContext(tempfile.TemporaryDirectory())
+        call_command('archive_activity', '--retention-days=90', '--batch-size=3', f'--archive-dir={archive_dir}',
+                     *args, stdout=StringIO())
+        return [os.path.join(archive_dir, name) for name in os.listdir(archive_dir)]
+
+    def summaries(self):
+        return set(UserActivityDailySummary.objects.values_list('user__username', 'action_type', 'date', 'count'))
+
+    def test_old_activity_is_rolled_up_and_deleted(self):
+        self.archive()
+        date = timezone.localdate(self.day)
+        self.assertEqual(self.summaries(), {
+            ('fan', 'like', date, 5), ('fan', 'follow', date, 1), ('artist', 'post', date, 1),
+        })
+        self.assertEqual(list(UserActivity.objects.values_list('pk', flat=True)), [self.recent.pk])
+
+    def test_archive_holds_every_deleted_row(self):
+        [path] = self.archive()
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            rows = {row['id']: row for row in map(json.loads, archive)}
+        self.assertCountEqual(rows, [activity.pk for activity in self.old])
+        follow = rows[self.old[2].pk]
+        self.assertEqual(set(follow), set(ARCHIVE_FIELDS))
+        self.assertEqual((follow['action_type'], follow['target_user_id']), ('follow', self.artist.pk))
+
+    def test_no_archive(self):
+        self.assertEqual(self.archive('--no-archive'), [])
+        self.assertEqual(UserActivity.objects.count(), 1)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    SEED_OPTIONS = ['--users=20', '--posts=40', '--likes=150', '--comments=30', '--carts=3', '--orders=5']
+
+    def seed(self, *args):
+        call_command('seed_data', *self.SEED_OPTIONS, *args, stdout=StringIO())
+
+    def test_seed_data_is_reproducible(self):
+        self.seed()
+        titles = list(Post.objects.order_by('pk').values_list('title', 'user__username', 'price'))
+        follows = Follow.objects.count()
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.seed('--replace')
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('title', 'user__username', 'price')), titles)
+        self.assertEqual(Follow.objects.count(), follows)
+        self.assertEqual((CustomUser.objects.count(), len(titles)), (20, 40))
+
+    def test_seeded_counters_match_the_rows(self):
+        self.seed()
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Checked 40 posts, fixed 0.', out.getvalue())
+        self.assertIn('Checked 20 users, fixed 0.', out.getvalue())
+        self.assertEqual(sum(Post.objects.values_list('likes_count', flat=True)), LikePost.objects.count())
+
+    def test_benchmark_endpoints_writes_a_baseline(self):
+        self.seed()
+        orders, unsold = Order.objects.count(), Post.objects.filter(is_sold=False).count()
+        output = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'benchmark.json')
+        call_command('benchmark_endpoints', '--iterations=2', '--warmup=0', '--memory-iterations=1',
+                     f'--output={output}', stdout=StringIO())
+        with open(output) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.assertEqual(baseline['rows'], {'users': 20, 'posts': 40})
+        self.assertEqual(set(baseline['endpoints']), {'posts', 'user_profile', 'user_activity', 'checkout'})
+        for result in baseline['endpoints'].values():
+            self.assertEqual(set(result), {'p50_ms', 'p95_ms', 'queries', 'peak_kib'})
+            self.assertGreater(result['queries'], 0)
+        # Checkouts were rolled back and the benchmark's token removed.
+        self.assertEqual((Order.objects.count(), Post.objects.filter(is_sold=False).count()), (orders, unsold))
+        self.assertFalse(AccessToken.objects.exists())
+
+
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', password='x')
+        cls.other = CustomUser.objects.create_user(username='other', password='x')
+        create_access_token(cls.artist, 'artist-token')
+
+    def test_refollow_counts_the_actor_once(self):
+        Follow.objects.create(follower=self.fan, following=self.artist)
+        Follow.objects.get(follower=self.fan, following=self.artist).delete()
+        Follow.objects.create(follower=self.fan, following=self.artist)
+        Follow.objects.create(follower=self.other, following=self.artist)
+        group = Notification.objects.get(recipient=self.artist, verb='follow')
+        self.assertEqual((group.actor_count, group.last_actor_id), (2, self.other.pk))
+
+    def test_returning_actor_counts_once(self):
+        # fan, other, then fan again after unfollowing.
+        Follow.objects.create(follower=self.fan, following=self.artist)
+        Follow.objects.create(follower=self.other, following=self.artist)
+        Follow.objects.get(follower=self.fan, following=self.artist).delete()
+        Follow.objects.create(follower=self.fan, following=self.artist)
+        group = Notification.objects.get(recipient=self.artist, verb='follow')
+        self.assertEqual((group.actor_count, group.last_actor_id), (2, self.fan.pk))
+        self.assertEqual(CustomUser.objects.get(pk=self.artist.pk).unread_notifications_count, 1)
+
+    def test_one_unread_follow_group(self):
+        Notification.objects.create(recipient=self.artist, verb='follow', last_actor=self.fan)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(recipient=self.artist, verb='follow', last_actor=self.other)
+
+    def test_mark_read_rejects_ids_that_are_not_integers(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer artist-token'
+        for ids in (['x'], [True], 'x'):
+            response = self.client.post('/api/notifications/read/', {'ids': ids}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+class EngagementEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.post = Post.objects.create(user=cls.artist, title='Dunes')
+
+    def setUp(self):
+        self.broker = LocalBroker()
+        patcher = mock.patch('core.events._broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unwatched_post_is_not_read_back(self):
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True):
+            publish_engagement(self.post.pk)
+
+    def test_watched_post_gets_its_counts(self):
+        subscription = mock.Mock()
+        self.broker.subscribers[post_channel(self.post.pk)].add(subscription)
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            publish_engagement(self.post.pk)
+        subscription.put.assert_called_once_with({
+            'type': 'engagement', 'post_id': self.post.pk, 'likes_count': 0, 'comments_count': 0, 'saves_count': 0,
+        })
+
+
+class AsyncBearerAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='viewer', password='x')
+        create_access_token(cls.user, 'viewer-token')
+
+    async def test_bearer_token_alongside_a_session_cookie(self):
+        # The session has to be looked up before the token, without
+        # blocking the event loop.
+        self.async_client.cookies['sessionid'] = 'expired-session'
+        response = await self.async_client.get('/api/async/users/me/', headers={'Authorization': 'Bearer viewer-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'viewer')
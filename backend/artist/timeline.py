@@ -0,0 +1,144 @@
+import heapq
+
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import CustomUser, Follow, Post, TimelineEntry
+from .pagination import KeysetPagination, keyset_filter
+
+# Both orderings are (created_at, post id), newest first. Entries mirror their
+# post's created_at, so a cursor from either one positions the other.
+ENTRY_ORDERING = ('-created_at', '-post_id')
+POST_ORDERING = ('-created_at', '-id')
+
+
+def get_fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+
+
+def get_backfill_size():
+    return getattr(settings, 'TIMELINE_BACKFILL_SIZE', 100)
+
+
+def get_max_entries():
+    return getattr(settings, 'TIMELINE_MAX_ENTRIES', 800)
+
+
+def is_fanout_author(user):
+    # Authors above the limit are never fanned out on write; their posts are
+    # merged into followers' timelines when the timeline is read instead.
+    return user.followers_count <= get_fanout_limit()
+
+
+def cap_timelines(user_ids, batch_size=100):
+    """Keep each of the users' timelines to its newest get_max_entries() posts."""
+    # The oldest entry worth keeping, read from the (user, created_at, post)
+    # index once per user; users under the cap have none. Entries sharing
+    # its timestamp are kept too.
+    oldest_kept = (
+        TimelineEntry.objects.filter(user_id=OuterRef('pk'))
+        .order_by(*ENTRY_ORDERING)
+        .values('created_at')[get_max_entries() - 1:get_max_entries()]
+    )
+    cutoffs = list(
+        CustomUser.objects.filter(pk__in=user_ids)
+        .annotate(cutoff=Subquery(oldest_kept))
+        .filter(cutoff__isnull=False)
+        .values_list('pk', 'cutoff')
+    )
+    for start in range(0, len(cutoffs), batch_size):
+        condition = Q()
+        for user_id, cutoff in cutoffs[start:start + batch_size]:
+            condition |= Q(user_id=user_id, created_at__lt=cutoff)
+        TimelineEntry.objects.filter(condition).delete()
+
+
+def fan_out_post(post, batch_size=1000):
+    if not is_fanout_author(post.user):
+        return
+    follower_ids = Follow.objects.filter(following=post.user).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=batch_size):
+        batch.append(follower_id)
+        if len(batch) >= batch_size:
+            write_entries(post, batch)
+            batch = []
+    if batch:
+        write_entries(post, batch)
+
+
+def write_entries(post, follower_ids):
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=follower_id, post=post, created_at=post.created_at) for follower_id in follower_ids],
+        ignore_conflicts=True,
+    )
+    cap_timelines(follower_ids)
+
+
+def backfill(follower, following):
+    if not is_fanout_author(following):
+        return
+    posts = Post.objects.filter(user=following).order_by('-created_at')[:get_backfill_size()]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=follower, post=post, created_at=post.created_at) for post in posts],
+        ignore_conflicts=True,
+    )
+    cap_timelines([follower.pk])
+
+
+def trim(follower, following):
+    TimelineEntry.objects.filter(user=follower, post__user=following).delete()
+
+
+def get_pulled_authors(viewer):
+    return list(
+        CustomUser.objects.filter(followers__follower=viewer, followers_count__gt=get_fanout_limit())
+        .values_list('id', flat=True)
+    )
+
+
+def timeline_entries(viewer, position=None):
+    """(created_at, post_id) of the viewer's materialized entries after ``position``."""
+    entries = TimelineEntry.objects.filter(user=viewer).order_by(*ENTRY_ORDERING)
+    if position is not None:
+        entries = entries.filter(keyset_filter(ENTRY_ORDERING, position))
+    return entries.values_list('created_at', 'post_id')
+
+
+def pulled_posts(author_id, position=None):
+    """(created_at, id) of a pulled author's posts after ``position``."""
+    posts = Post.objects.filter(user_id=author_id).order_by(*POST_ORDERING)
+    if position is not None:
+        posts = posts.filter(keyset_filter(POST_ORDERING, position))
+    return posts.values_list('created_at', 'id')
+
+
+def get_timeline_page(viewer, queryset, position, limit):
+    """
+    The next ``limit`` posts of the viewer's following feed, newest first.
+
+    Each source (the materialized timeline and every pulled author) is read
+    as one bounded index range, so the page never sorts the whole timeline;
+    the newest ``limit`` of those candidates are then loaded from
+    ``queryset``.
+    """
+    candidates = list(timeline_entries(viewer, position)[:limit])
+    # One query per pulled author: only authors above the fan-out limit are
+    # pulled, so there are few, and a LIMIT per author cannot be expressed
+    # in a UNION on every backend.
+    for author_id in get_pulled_authors(viewer):
+        candidates += pulled_posts(author_id, position)[:limit]
+    # A post can be in both when its author crossed the fan-out limit.
+    window = heapq.nlargest(limit, set(candidates))
+    posts = queryset.in_bulk([post_id for _, post_id in window])
+    return [posts[post_id] for _, post_id in window if post_id in posts]
+
+
+class TimelinePagination(KeysetPagination):
+    ordering = POST_ORDERING
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        return self.paginate_results(get_timeline_page(request.user, queryset, position, self.page_size + 1))
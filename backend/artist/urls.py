@@ -5,14 +5,16 @@ from .views import (
     LikePostListCreateView, LikePostDetailView,
     CommentListCreateView, CommentDetailView,
     FollowListCreateView, FollowDetailView,
-    UserActivityView, login, register, get_user_data,
+    UserActivityView, login, logout, register, get_user_data,
     UserFollowersView, UserFollowingView, UserSearchView
 )
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('posts/', PostListCreateView.as_view(), name='post-list-create'),
     path('posts/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
+    path('posts/search/', views.PostSearchView.as_view(), name='post-search'),
+    path('feed/', views.FollowingFeedView.as_view(), name='following-feed'),
     path('save-posts/', SavePostListCreateView.as_view(), name='save-post-list-create'),
     path('save-posts/<int:pk>/', SavePostDetailView.as_view(), name='save-post-detail'),
     path('like-posts/', LikePostListCreateView.as_view(), name='like-post-list-create'),
@@ -24,13 +26,23 @@ urlpatterns = [
     path('user-activity/', UserActivityView.as_view(), name='user-activity'),
     path('user-activity/<str:username>/', UserActivityView.as_view(), name='user-activity-detail'),
     path('login/', login, name='login'),
+    path('logout/', logout, name='logout'),
     path('register/', register, name='register'),
     path('me/', get_user_data, name='user-data'),
+    path('users/search/', UserSearchView.as_view(), name='user-search'),
     path('users/<str:username>/', views.UserProfileView.as_view(), name='user-profile'),
     path('users/<str:username>/posts/', views.UserPostsView.as_view(), name='user-posts'),
     path('users/<str:username>/followers/', UserFollowersView.as_view(), name='user-followers'),
     path('users/<str:username>/following/', UserFollowingView.as_view(), name='user-following'),
-    path('users/search/', UserSearchView.as_view(), name='user-search'),
+    path('notifications/', views.NotificationListView.as_view(), name='notification-list'),
+    path('notifications/unread-count/', views.unread_notifications_count, name='notification-unread-count'),
+    path('notifications/read/', views.mark_notifications_read, name='notification-mark-read'),
+    path('events/', views.event_stream, name='event-stream'),
+    path('async/posts/', async_views.post_list, name='async-post-list'),
+    path('async/posts/<int:pk>/', async_views.post_detail, name='async-post-detail'),
+    path('async/users/<str:username>/', async_views.user_profile, name='async-user-profile'),
+    path('async/user-activity/', async_views.user_activity, name='async-user-activity'),
+    path('async/user-activity/<str:username>/', async_views.user_activity, name='async-user-activity-detail'),
     path('follows/toggle/', views.follow_user, name='follow-user'),
     path('follows/check/<str:username>/', views.check_follow, name='check-follow'),
 ]
\ No newline at end of file
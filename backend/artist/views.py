@@ -1,11 +1,26 @@
 from django.shortcuts import render
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView, RetrieveUpdateAPIView
-from .models import Post, SavePost, LikePost, Comment, Follow, CustomUser, UserActivity
+from .models import Post, SavePost, LikePost, Comment, Follow, CustomUser, UserActivity, Notification
 from .serializers import (
     PostSerializer, SavePostSerializer, LikePostSerializer, 
     CommentSerializer, FollowSerializer, UserActivitySerializer,
-    UserSerializer
+    UserSerializer, UserAutocompleteSerializer, UserActivityCompactSerializer,
+    NotificationSerializer
 )
+from .pagination import (
+    KeysetPagination, FollowPagination, SearchPagination, ActivityPagination,
+    NotificationPagination
+)
+from .notifications import mark_read
+from .events import post_channel, user_channel
+from core.authentication import aauthenticate
+from core.idempotency import idempotent
+from core.events import get_broker
+from django.http import JsonResponse, StreamingHttpResponse
+import asyncio
+import json
+from .search import search_posts
+from .timeline import TimelinePagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -16,7 +31,9 @@ from rest_framework import status
 from django.shortcuts import get_object_or_404
 from rest_framework import generics
 from rest_framework import viewsets
-from django.db.models import Q
+from django.db.models import F, Q
+from decimal import Decimal, InvalidOperation
+from rest_framework.exceptions import ValidationError
 
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
@@ -38,9 +55,10 @@ def get_user_data(request):
 class PostListCreateView(ListCreateAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Post.objects.all().order_by('-created_at')
+        return Post.objects.with_engagement(self.request.user).order_by('-created_at')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -51,15 +69,58 @@ class PostListCreateView(ListCreateAPIView):
         return context
 
 class PostDetailView(RetrieveUpdateDestroyAPIView):
-    queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Post.objects.with_engagement(self.request.user)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+class PostSearchView(generics.ListAPIView):
+    serializer_class = PostSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = Post.objects.with_engagement(self.request.user)
+
+        category = params.get('category')
+        if category:
+            queryset = queryset.filter(category=category)
+        if params.get('is_sold') in ('true', 'false'):
+            # __in compiles to "is_sold IN (…)", which can use the category
+            # index; an exact False lookup becomes "NOT is_sold", which can't.
+            queryset = queryset.filter(is_sold__in=[params['is_sold'] == 'true'])
+        for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            if params.get(param):
+                try:
+                    value = Decimal(params[param])
+                except InvalidOperation:
+                    value = None
+                # Decimal also parses NaN and Infinity, which no price field holds.
+                if value is None or not value.is_finite():
+                    raise ValidationError({param: 'A valid number is required.'})
+                queryset = queryset.filter(**{lookup: value})
+
+        query = params.get('q', '').strip()
+        if not query:
+            return queryset.order_by('-created_at')
+        return search_posts(queryset, query)
+
+class FollowingFeedView(generics.ListAPIView):
+    serializer_class = PostSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = TimelinePagination
+
+    def get_queryset(self):
+        # Only hydrates the page; TimelinePagination picks the posts.
+        return Post.objects.with_engagement(self.request.user)
+
 class SavePostListCreateView(ListCreateAPIView):
     serializer_class = SavePostSerializer
     permission_classes = [IsAuthenticated]
@@ -67,6 +128,10 @@ class SavePostListCreateView(ListCreateAPIView):
     def get_queryset(self):
         return SavePost.objects.filter(user=self.request.user).order_by('-created_at')
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         post_id = self.request.data.get('post_id')
         post = get_object_or_404(Post, id=post_id)
@@ -174,24 +239,43 @@ class FollowDetailView(RetrieveUpdateDestroyAPIView):
         return Follow.objects.filter(follower=self.request.user)
 
 class UserActivityView(ListCreateAPIView):
-    serializer_class = UserActivitySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ActivityPagination
+
+    def get_serializer_class(self):
+        # Compact rows by default; ?expand=full returns the nested post and
+        # user representations.
+        if self.request.method == 'GET' and self.request.query_params.get('expand') != 'full':
+            return UserActivityCompactSerializer
+        return UserActivitySerializer
 
     def get_queryset(self):
         username = self.kwargs.get('username')
         if username:
             user = get_object_or_404(CustomUser, username=username)
-            return UserActivity.objects.filter(user=user).order_by('-timestamp')
-        return UserActivity.objects.filter(user=self.request.user).order_by('-timestamp')
+        else:
+            user = self.request.user
+        queryset = UserActivity.objects.filter(user=user).select_related('user', 'target_post', 'target_user')
+        if self.get_serializer_class() is UserActivityCompactSerializer:
+            queryset = queryset.only(
+                'id', 'action_type', 'description', 'timestamp',
+                'user__id', 'user__username', 'user__profile_picture', 'user__profile_picture_variants',
+                'target_post__id', 'target_post__title', 'target_post__image', 'target_post__image_variants',
+                'target_user__id', 'target_user__username', 'target_user__profile_picture',
+                'target_user__profile_picture_variants',
+            )
+        return queryset.order_by('-timestamp')
     
 
 from django.conf import settings
-from django.test import RequestFactory
+from django.contrib.auth import authenticate
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from oauth2_provider.views import TokenView
+from core.tokens import issue_token, token_response
+from oauth2_provider.models import get_application_model, get_refresh_token_model
+from django.utils import timezone
 
 
 @api_view(["POST"])
@@ -206,32 +290,36 @@ def login(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Prepare an internal request for the token endpoint
-    factory = RequestFactory()
-    token_request = factory.post(
-        '/o/token/',
-        {
-            'grant_type': 'password',
-            'username': username,
-            'password': password,
-            'client_id': settings.CLIENT_ID,
-            'client_secret': settings.CLIENT_SECRET,
-        }
-    )
-
-    # Call TokenView internally
-    token_view = TokenView.as_view()
-    token_response = token_view(token_request)
+    user = authenticate(request._request, username=username, password=password)
+    if user is None:
+        return Response(
+            {"detail": "Invalid credentials"},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
 
-    # If authentication failed, return error
-    if token_response.status_code != 200:
+    try:
+        access_token, refresh_token = issue_token(user)
+    except get_application_model().DoesNotExist:
+        # No OAuth2 application for CLIENT_ID: TokenView answered this
+        # with invalid_client, which the client saw as a failed login.
         return Response(
             {"detail": "Invalid credentials"},
             status=status.HTTP_401_UNAUTHORIZED
         )
+    return Response(
+        token_response(access_token, refresh_token),
+        headers={'Cache-Control': 'no-store', 'Pragma': 'no-cache'},
+    )
 
-    # Return OAuth token JSON
-    return token_response
+@api_view(["POST"])
+def logout(request):
+    # Revoking deletes the access token, which also drops it from the
+    # token cache; the paired refresh token must not mint a new one.
+    access_token = request.auth
+    if access_token is not None:
+        get_refresh_token_model().objects.filter(access_token=access_token).update(revoked=timezone.now())
+        access_token.revoke()
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(["POST"])
 @permission_classes([AllowAny])
@@ -282,18 +370,20 @@ class UserProfileView(generics.RetrieveAPIView):
         username = self.kwargs.get('username', None)
         if username == 'me' or not username:
             return self.request.user
-        return get_object_or_404(CustomUser, username=username)
+        return get_object_or_404(CustomUser.objects.with_follow_state(self.request.user), username=username)
 
 class UserPostsView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = PostSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         username = self.kwargs.get('username', None)
         if username == 'me' or not username:
-            return Post.objects.filter(user=self.request.user).order_by('-created_at')
-        user = get_object_or_404(CustomUser, username=username)
-        return Post.objects.filter(user=user).order_by('-created_at')
+            user = self.request.user
+        else:
+            user = get_object_or_404(CustomUser, username=username)
+        return Post.objects.with_engagement(self.request.user).filter(user=user).order_by('-created_at')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -303,7 +393,9 @@ class UserPostsView(generics.ListAPIView):
 class PostViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = PostSerializer
-    queryset = Post.objects.all().order_by('-created_at')
+
+    def get_queryset(self):
+        return Post.objects.with_engagement(self.request.user).order_by('-created_at')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -315,6 +407,7 @@ class PostViewSet(viewsets.ModelViewSet):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def follow_user(request):
     try:
         username = request.data.get('username')
@@ -379,6 +472,7 @@ def check_follow(request, username):
 class UserFollowersView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
+    pagination_class = FollowPagination
 
     def get_queryset(self):
         username = self.kwargs.get('username', None)
@@ -388,22 +482,16 @@ class UserFollowersView(generics.ListAPIView):
             user = get_object_or_404(CustomUser, username=username)
         
         # Get all users who follow the target user
-        followers = CustomUser.objects.filter(
+        return CustomUser.objects.filter(
             following__following=user
-        ).distinct()
-
-        # Add is_following field to each user
-        for follower in followers:
-            follower.is_following = Follow.objects.filter(
-                follower=self.request.user,
-                following=follower
-            ).exists()
-
-        return followers
+        ).annotate(
+            follow_id=F('following__id')
+        ).with_follow_state(self.request.user)
 
 class UserFollowingView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
+    pagination_class = FollowPagination
 
     def get_queryset(self):
         username = self.kwargs.get('username', None)
@@ -413,18 +501,11 @@ class UserFollowingView(generics.ListAPIView):
             user = get_object_or_404(CustomUser, username=username)
         
         # Get all users who the target user follows
-        following = CustomUser.objects.filter(
+        return CustomUser.objects.filter(
             followers__follower=user
-        ).distinct()
-
-        # Add is_following field to each user
-        for followed_user in following:
-            followed_user.is_following = Follow.objects.filter(
-                follower=self.request.user,
-                following=followed_user
-            ).exists()
-
-        return following
+        ).annotate(
+            follow_id=F('followers__id')
+        ).with_follow_state(self.request.user)
 
 class UserSearchView(APIView):
     permission_classes = [IsAuthenticated]
@@ -434,7 +515,24 @@ class UserSearchView(APIView):
         if not query:
             return Response([])
 
-        users = CustomUser.objects.filter(
+        if request.query_params.get('mode') == 'autocomplete':
+            candidates = CustomUser.objects.exclude(id=request.user.id).only(
+                'id', 'username', 'profile_picture', 'profile_picture_variants'
+            )
+            # Username matches first, then full name and last name matches
+            users = list(candidates.with_key_prefix('username_key', query)[:10])
+            seen = {user.id for user in users}
+            for field in ('name_key', 'last_name_key'):
+                if len(users) >= 10:
+                    break
+                for user in candidates.with_key_prefix(field, query)[:10]:
+                    if user.id not in seen and len(users) < 10:
+                        seen.add(user.id)
+                        users.append(user)
+            serializer = UserAutocompleteSerializer(users, many=True, context={'request': request})
+            return Response(serializer.data)
+
+        users = CustomUser.objects.with_follow_state(request.user).filter(
             Q(username__icontains=query) |
             Q(first_name__icontains=query) |
             Q(last_name__icontains=query)
@@ -443,5 +541,63 @@ class UserSearchView(APIView):
         serializer = UserSerializer(users, many=True, context={'request': request})
         return Response(serializer.data)
 
+class NotificationListView(generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(recipient=self.request.user).select_related('last_actor', 'target_post')
+        if self.request.query_params.get('unread') == 'true':
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_notifications_count(request):
+    return Response({'unread_count': request.user.unread_notifications_count})
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    ids = request.data.get('ids')
+    if ids is not None and not (
+        isinstance(ids, list) and all(isinstance(id, int) and not isinstance(id, bool) for id in ids)
+    ):
+        return Response({'detail': 'ids must be a list of notification ids'}, status=status.HTTP_400_BAD_REQUEST)
+    marked = mark_read(request.user, ids)
+    request.user.refresh_from_db(fields=['unread_notifications_count'])
+    return Response({'marked': marked, 'unread_count': request.user.unread_notifications_count})
+
+MAX_STREAM_POSTS = 100
+STREAM_KEEPALIVE_SECONDS = 15
+
+async def event_stream(request):
+    # Server-Sent Events: engagement updates for ?posts=1,2,3 plus the
+    # caller's own notification channel. Runs natively under ASGI.
+    user = await aauthenticate(request, allow_query_param=True)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
 
+    try:
+        post_ids = [int(post_id) for post_id in request.GET.get('posts', '').split(',') if post_id]
+    except ValueError:
+        return JsonResponse({'detail': 'posts must be a comma-separated list of ids'}, status=400)
+    channels = [post_channel(post_id) for post_id in post_ids[:MAX_STREAM_POSTS]]
+    channels.append(user_channel(user.id))
+
+    async def stream():
+        async with get_broker().subscribe(channels) as subscription:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,221 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model
+
+
+def get_bearer_token(request, allow_query_param=False):
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        return token.strip()
+    if allow_query_param:
+        # EventSource cannot send headers, so streams may pass the token in
+        # the query string instead.
+        return request.GET.get('access_token') or None
+    return None
+
+
+def token_checksum(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """
+    Validated access tokens by checksum, so the hot path skips the
+    AccessToken lookup and oauthlib validation.
+
+    Entries hold the token and its user's id, never the user row: counters
+    on it are updated with queryset.update() and would go stale, so the
+    user is loaded on every request. Entries live in a per-process LRU and,
+    when OAUTH2_TOKEN_CACHE_ALIAS names a Django cache, in that shared cache
+    too. An entry never outlives its token. Revoking a token drops the entry
+    here and in the shared cache; other processes' LRUs only hold it for at
+    most OAUTH2_TOKEN_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'OAUTH2_TOKEN_CACHE_TTL', 60)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'OAUTH2_TOKEN_CACHE_SIZE', 10000)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'OAUTH2_TOKEN_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    def cache_key(self, checksum):
+        return f'oauth2-token:{checksum}'
+
+    def get(self, checksum):
+        entry = self.get_local(checksum)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(self.cache_key(checksum))
+            if entry is not None:
+                self.set_local(checksum, entry)
+        return self.unpack(entry)
+
+    async def aget(self, checksum):
+        entry = self.get_local(checksum)
+        if entry is None and self.shared is not None:
+            entry = await self.shared.aget(self.cache_key(checksum))
+            if entry is not None:
+                self.set_local(checksum, entry)
+        return self.unpack(entry)
+
+    def set(self, checksum, access_token):
+        entry, timeout = self.pack(access_token)
+        if timeout <= 0:
+            return
+        self.set_local(checksum, entry)
+        if self.shared is not None:
+            self.shared.set(self.cache_key(checksum), entry, timeout)
+
+    async def aset(self, checksum, access_token):
+        entry, timeout = self.pack(access_token)
+        if timeout <= 0:
+            return
+        self.set_local(checksum, entry)
+        if self.shared is not None:
+            await self.shared.aset(self.cache_key(checksum), entry, timeout)
+
+    def invalidate(self, *checksums):
+        with self.lock:
+            for checksum in checksums:
+                self.entries.pop(checksum, None)
+        if self.shared is not None and checksums:
+            self.shared.delete_many([self.cache_key(checksum) for checksum in checksums])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def pack(self, access_token):
+        remaining = (access_token.expires - timezone.now()).total_seconds()
+        timeout = min(self.ttl, remaining)
+        token = copy.copy(access_token)
+        # Drop the select_related user so it is never cached with the token.
+        token._state = copy.copy(access_token._state)
+        token._state.fields_cache = {}
+        return (access_token.user_id, token, time.time() + timeout), int(timeout)
+
+    def unpack(self, entry):
+        if entry is None:
+            return None
+        user_id, access_token, _ = entry
+        return user_id, copy.copy(access_token)
+
+    def get_local(self, checksum):
+        with self.lock:
+            entry = self.entries.get(checksum)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self.entries[checksum]
+                return None
+            self.entries.move_to_end(checksum)
+            return entry
+
+    def set_local(self, checksum, entry):
+        if entry[2] <= time.time():
+            return
+        with self.lock:
+            self.entries[checksum] = entry
+            self.entries.move_to_end(checksum)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+def valid_token(access_token):
+    return (
+        access_token is not None
+        and access_token.is_valid()
+        and access_token.user is not None
+        and access_token.user.is_active
+    )
+
+
+def access_tokens():
+    return get_access_token_model().objects.select_related('user')
+
+
+def active_users():
+    return get_user_model().objects.filter(is_active=True)
+
+
+def with_user(access_token, user):
+    access_token._state = copy.copy(access_token._state)
+    access_token._state.fields_cache = {'user': user}
+    return user, access_token
+
+
+def authenticate_token(request, allow_query_param=False):
+    """The (user, access token) pair for the request's bearer token, or None."""
+    token = get_bearer_token(request, allow_query_param)
+    if not token:
+        return None
+    checksum = token_checksum(token)
+    cached = token_cache.get(checksum)
+    if cached is not None:
+        user_id, access_token = cached
+        user = active_users().filter(pk=user_id).first()
+        return with_user(access_token, user) if user is not None else None
+    access_token = access_tokens().filter(token_checksum=checksum).first()
+    if not valid_token(access_token):
+        return None
+    token_cache.set(checksum, access_token)
+    return access_token.user, access_token
+
+
+async def aauthenticate(request, allow_query_param=False):
+    """Async counterpart of authenticate_token: the token's user or None."""
+    token = get_bearer_token(request, allow_query_param)
+    if not token:
+        return None
+    checksum = token_checksum(token)
+    cached = await token_cache.aget(checksum)
+    if cached is not None:
+        return await active_users().filter(pk=cached[0]).afirst()
+    access_token = await access_tokens().filter(token_checksum=checksum).afirst()
+    if not valid_token(access_token):
+        return None
+    await token_cache.aset(checksum, access_token)
+    return access_token.user
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """OAuth2Authentication that validates bearer headers through token_cache."""
+
+    def authenticate(self, request):
+        if get_bearer_token(request) is None:
+            # Tokens passed in the body still go through oauthlib.
+            return super().authenticate(request)
+        if hasattr(request._request, '_bearer_authentication'):
+            # Already resolved by OAuth2TokenMiddleware.
+            result = request._request._bearer_authentication
+        else:
+            result = authenticate_token(request)
+        if result is None:
+            request.oauth2_error = {
+                'error': 'invalid_token',
+                'error_description': 'The access token is invalid.',
+            }
+        return result
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """A bounded per-client queue, fed from any thread."""
+
+    def __init__(self, loop, maxsize=100):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's event loop has already shut down.
+            pass
+
+    def _put(self, message):
+        # A client that stopped reading loses messages rather than letting
+        # its queue grow without bound.
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """
+    In-process pub/sub; only reaches subscribers in the same process.
+
+    With several workers (gunicorn -w N, several uvicorn processes) a client
+    only hears about writes its own worker handled, so deployments like that
+    set EVENTS_BROKER to DatabaseBroker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def has_listeners(self, channel):
+        with self.lock:
+            return channel in self.subscribers
+
+    def dispatch(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def on_subscribe(self):
+        pass
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        self.on_subscribe()
+        subscription = Subscription(asyncio.get_running_loop())
+        with self.lock:
+            for channel in channels:
+                self.subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self.lock:
+                for channel in channels:
+                    self.subscribers[channel].discard(subscription)
+                    if not self.subscribers[channel]:
+                        del self.subscribers[channel]
+
+
+class DatabaseBroker(LocalBroker):
+    """
+    Pub/sub across worker processes through the core_event table.
+
+    publish() inserts a row; every process with subscribers polls for rows
+    newer than the last one it saw and dispatches them locally. Rows older
+    than EVENTS_RETENTION_SECONDS are pruned by the pollers.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.poller = None
+
+    def publish(self, channel, message):
+        from .models import Event
+        Event.objects.create(channel=channel, payload=message)
+
+    def has_listeners(self, channel):
+        # Subscribers in other processes are unknown here.
+        return True
+
+    def on_subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.poller is None or self.poller.done() or self.poller.get_loop() is not loop:
+            self.poller = loop.create_task(self.poll())
+
+    async def poll(self):
+        from .models import Event
+        interval = getattr(settings, 'EVENTS_POLL_INTERVAL', 0.5)
+        retention = timedelta(seconds=getattr(settings, 'EVENTS_RETENTION_SECONDS', 60))
+        latest = await Event.objects.order_by('-id').values_list('id', flat=True).afirst()
+        last_id = latest or 0
+        last_prune = timezone.now()
+        while True:
+            try:
+                async for event in Event.objects.filter(id__gt=last_id).order_by('id')[:500]:
+                    self.dispatch(event.channel, event.payload)
+                    last_id = event.id
+                if timezone.now() - last_prune > retention:
+                    last_prune = timezone.now()
+                    await Event.objects.filter(created_at__lt=last_prune - retention).adelete()
+            except Exception:
+                logger.exception('Event poller failed; retrying')
+            await asyncio.sleep(interval)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'core.events.LocalBroker'))()
+        return _broker
+
+
+def publish(channel, message):
+    """
+    Publishes ``message`` once the current transaction commits.
+
+    ``message`` may be a callable, called only when the channel has
+    listeners; returning None skips the publish.
+    """
+    def send():
+        broker = get_broker()
+        if not broker.has_listeners(channel):
+            return
+        payload = message() if callable(message) else message
+        if payload is not None:
+            broker.publish(channel, payload)
+
+    # Subscribers only hear about writes that actually committed.
+    transaction.on_commit(send)
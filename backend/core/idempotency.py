@@ -0,0 +1,130 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# 4xx responses that describe a passing condition rather than the request
+# itself, so a retry with the same key deserves a fresh attempt.
+RETRYABLE_STATUSES = {
+    status.HTTP_408_REQUEST_TIMEOUT,
+    status.HTTP_409_CONFLICT,
+    status.HTTP_423_LOCKED,
+    status.HTTP_425_TOO_EARLY,
+    status.HTTP_429_TOO_MANY_REQUESTS,
+}
+
+
+def fingerprint(request):
+    # Reusing a key for a different request is a client bug, not a retry.
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def should_store(response):
+    if not isinstance(response, Response):
+        return False
+    code = response.status_code
+    return 200 <= code < 300 or (400 <= code < 500 and code not in RETRYABLE_STATUSES)
+
+
+def is_stale(record, now):
+    # Past its TTL, or still pending after its lease: the worker running it
+    # was killed or the key was never released, so it is free again.
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    lease = getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 60)
+    age = now - record.created_at
+    return age > timedelta(seconds=ttl) or (record.status_code is None and age > timedelta(seconds=lease))
+
+
+def claim(user, key, digest):
+    """
+    Record that the request for ``key`` is running. Returns (record, True)
+    when this request owns the key, otherwise the earlier request's row and
+    False.
+    """
+    record = None
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, fingerprint=digest), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is not None and not is_stale(record, timezone.now()):
+            return record, False
+        if record is not None:
+            # Only delete the row we judged stale, not one a racing retry
+            # has just created.
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+    return record, False
+
+
+def replay(record, digest):
+    if record is None or record.status_code is None:
+        return Response(
+            {'detail': f'A request with this {HEADER} is still being processed.'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    if record.fingerprint != digest:
+        return Response(
+            {'detail': f'This {HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Replay the first response to retries that send the same Idempotency-Key.
+
+    Wraps a DRF view method or an @api_view function (below the decorator),
+    so it runs after authentication. Requests without the header are not
+    affected. Only successes and 4xx responses that a retry would repeat are
+    stored; anything else, including exceptions, releases the key. Stored
+    responses are replayed for IDEMPOTENCY_KEY_TTL seconds, and
+    `manage.py purge_idempotency_keys` deletes the expired keys.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[0] if isinstance(args[0], Request) else args[1]
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        digest = fingerprint(request)
+        record, claimed = claim(request.user, key, digest)
+        if not claimed:
+            return replay(record, digest)
+
+        # Scoped to this claim, so a request that outlived its lease cannot
+        # overwrite the row of the retry that took the key over.
+        pending = IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True)
+        try:
+            response = view(*args, **kwargs)
+        except Exception:
+            pending.delete()
+            raise
+        if should_store(response):
+            pending.update(status_code=response.status_code, response=response.data)
+        else:
+            pending.delete()
+        return response
+    return wrapper
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.db import connections
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import BaseSerializer
+
+# Per-request SQL, serializer and view timings for
+# core.middleware.RequestInstrumentationMiddleware. Queries are recorded by an
+# execute wrapper on every connection and serializers by wrapping
+# BaseSerializer.data; both only do work while a request is being measured,
+# which a context variable tracks across sync_to_async. Nothing is wrapped
+# until the middleware is enabled, and turning REQUEST_INSTRUMENTATION off
+# again (override_settings) unwraps it.
+_current = ContextVar('request_metrics', default=None)
+_install_lock = threading.Lock()
+_serializer_data = None
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = Counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_queries = 0
+        self.view_time = 0.0
+        self.serializing = False
+
+    def record_query(self, sql, duration):
+        self.queries[sql] += 1
+        self.query_count += 1
+        self.sql_time += duration
+
+    def duplicates(self, threshold):
+        # The same SQL text repeated with different parameters is the
+        # signature of an N+1 lookup, typically from a nested serializer.
+        return [(sql, count) for sql, count in self.queries.most_common() if count >= threshold]
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'serialize;dur={self.serializer_time * 1000:.1f}',
+            f'view;dur={self.view_time * 1000:.1f}',
+        ))
+
+    def as_dict(self):
+        return {
+            'queries': self.query_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'serializer_ms': round(self.serializer_time * 1000, 2),
+            'serializer_queries': self.serializer_queries,
+            'view_ms': round(self.view_time * 1000, 2),
+        }
+
+
+def start():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def record_queries(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def add_query_recorder(sender, connection, **kwargs):
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def timed_serializer_data(data):
+    def wrapper(self):
+        metrics = _current.get()
+        # Nested serializers render through to_representation(), so only the
+        # outermost .data access is timed.
+        if metrics is None or metrics.serializing:
+            return data(self)
+        metrics.serializing = True
+        queries = metrics.query_count
+        started = time.perf_counter()
+        try:
+            return data(self)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_queries += metrics.query_count - queries
+            metrics.serializing = False
+    return wrapper
+
+
+def install():
+    global _serializer_data
+    with _install_lock:
+        if _serializer_data is not None:
+            return
+        connection_created.connect(add_query_recorder, dispatch_uid='core.instrumentation')
+        for connection in connections.all(initialized_only=True):
+            add_query_recorder(None, connection)
+        _serializer_data = BaseSerializer.data
+        BaseSerializer.data = property(timed_serializer_data(_serializer_data.fget))
+
+
+def uninstall():
+    global _serializer_data
+    with _install_lock:
+        if _serializer_data is None:
+            return
+        BaseSerializer.data = _serializer_data
+        _serializer_data = None
+        connection_created.disconnect(dispatch_uid='core.instrumentation')
+        # Connections of other threads keep the recorder, which is a no-op
+        # outside a measured request, until they are closed.
+        for connection in connections.all(initialized_only=True):
+            if record_queries in connection.execute_wrappers:
+                connection.execute_wrappers.remove(record_queries)
+
+
+@receiver(setting_changed)
+def uninstall_when_disabled(setting, value, **kwargs):
+    if setting == 'REQUEST_INSTRUMENTATION' and not value:
+        uninstall()
@@ -0,0 +1,144 @@
+import logging
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+# Jobs are core_job rows run by `manage.py run_jobs` workers. A claimed job
+# is locked for JOB_QUEUE_VISIBILITY_TIMEOUT seconds, renewed by its worker's
+# heartbeat, and can be claimed again once the lock lapses.
+logger = logging.getLogger(__name__)
+
+
+def task_path(task):
+    if isinstance(task, str):
+        return task
+    return f'{task.__module__}.{task.__qualname__}'
+
+
+def enqueue(task, max_attempts=3, delay=None, **kwargs):
+    """
+    Queue ``task`` (a function or its dotted path) to run in a worker with
+    the JSON-serializable ``kwargs``.
+
+    With ``JOB_QUEUE_EAGER`` the task runs immediately in-process instead,
+    which is what tests and single-process setups without a worker use.
+    """
+    path = task_path(task)
+    if getattr(settings, 'JOB_QUEUE_EAGER', False):
+        import_string(path)(**kwargs)
+        return None
+    run_at = timezone.now() + delay if delay else timezone.now()
+    return Job.objects.create(task=path, kwargs=kwargs, max_attempts=max_attempts, run_at=run_at)
+
+
+def get_visibility_timeout():
+    return getattr(settings, 'JOB_QUEUE_VISIBILITY_TIMEOUT', 300)
+
+
+def claimable(now):
+    # Queued jobs that are due, plus running jobs whose worker stopped
+    # renewing its lease (crashed or was killed) before finishing, as long
+    # as they have attempts left.
+    return (
+        Q(status='queued', run_at__lte=now)
+        | Q(status='running', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+
+def fail_abandoned_jobs(now):
+    # A job that kills its worker every time (say, out of memory) never
+    # reaches run_job's exception handling, so its attempts run out here.
+    return Job.objects.filter(
+        status='running', locked_until__lt=now, attempts__gte=F('max_attempts'),
+    ).update(
+        status='failed', locked_until=None,
+        last_error='The worker running the last attempt stopped before it finished.',
+    )
+
+
+def claim_jobs(limit, visibility_timeout=None):
+    visibility_timeout = visibility_timeout or get_visibility_timeout()
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        if fail_abandoned_jobs(now):
+            logger.error('Marked jobs failed after their workers stopped on the last attempt.')
+        ids = list(
+            Job.objects.filter(claimable(now))
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # Re-check the claim condition in the UPDATE itself so two workers
+        # racing for the same rows cannot both win them.
+        Job.objects.filter(claimable(now), id__in=ids).update(
+            status='running',
+            locked_by=token,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status='running'))
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'JOB_QUEUE_RETRY_DELAY', 10)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+@contextmanager
+def heartbeat(job, visibility_timeout):
+    """Keep extending the job's lease while it runs, so no other worker claims it."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(visibility_timeout / 3):
+                try:
+                    Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status='running').update(
+                        locked_until=timezone.now() + timedelta(seconds=visibility_timeout),
+                    )
+                except DatabaseError:
+                    logger.warning('Could not extend the lease of job %s', job.pk, exc_info=True)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job, visibility_timeout=None):
+    try:
+        with heartbeat(job, visibility_timeout or get_visibility_timeout()):
+            import_string(job.task)(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) failed permanently:\n%s', job.pk, job.task, error)
+            Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+                status='failed', locked_until=None, last_error=error,
+            )
+        else:
+            logger.warning('Job %s (%s) failed, retrying:\n%s', job.pk, job.task, error)
+            Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+                status='queued', locked_until=None, last_error=error,
+                run_at=timezone.now() + retry_delay(job.attempts),
+            )
+        return False
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).delete()
+    return True
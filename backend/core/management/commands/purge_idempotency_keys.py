@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete stored idempotency keys older than IDEMPOTENCY_KEY_TTL, and pending ones '
+        'older than IDEMPOTENCY_KEY_LEASE, in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired_at = now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+        abandoned_at = now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 60))
+        expired = IdempotencyKey.objects.filter(
+            Q(created_at__lt=expired_at) | Q(status_code__isnull=True, created_at__lt=abandoned_at)
+        ).order_by('pk')
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            IdempotencyKey.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} idempotency keys.'))
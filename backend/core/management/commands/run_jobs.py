@@ -0,0 +1,56 @@
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.jobs import claim_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument(
+            '--visibility-timeout', type=int,
+            default=getattr(settings, 'JOB_QUEUE_VISIBILITY_TIMEOUT', 300),
+            help='Seconds a claimed job stays invisible to other workers; renewed while it runs.',
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.visibility_timeout = options['visibility_timeout']
+        processed = failed = 0
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            while not self.stopping:
+                jobs = claim_jobs(options['batch_size'], options['visibility_timeout'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for succeeded in pool.map(self.run_in_thread, jobs):
+                    processed += 1
+                    failed += not succeeded
+                close_old_connections()
+
+        self.stdout.write(f'Processed {processed} jobs, {failed} failed.')
+
+    def run_in_thread(self, job):
+        try:
+            return run_job(job, self.visibility_timeout)
+        finally:
+            # Each pool thread has its own connection; don't leak them.
+            connection.close()
+
+    def stop(self, signum, frame):
+        self.stopping = True
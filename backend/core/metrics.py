@@ -0,0 +1,272 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Prometheus metrics shared by every worker process. Each process keeps its
+# samples in memory and writes them to <METRICS_DIR>/<pid>.json at most every
+# METRICS_FLUSH_INTERVAL seconds (METRICS_DIR defaults to a directory under
+# the system temp dir); the metrics view sums all files. Gauges from
+# processes that have exited are dropped at once; their files are removed
+# when the next worker starts, which Prometheus sees as a counter reset.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def key(self, labels):
+        return self.name, tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        store.add(self.key(labels), amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        store.add(self.key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        store.add(self.key(labels), -amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        # Stored as per-bucket counts (the last one is +Inf), then sum and count.
+        sample = [0] * (len(self.buckets) + 3)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample[index] = 1
+                break
+        else:
+            sample[len(self.buckets)] = 1
+        sample[-2] = value
+        sample[-1] = 1
+        store.add(self.key(labels), sample)
+
+
+def add(current, amount):
+    if isinstance(amount, list):
+        return [a + b for a, b in zip(current or [0] * len(amount), amount)]
+    return (current or 0) + amount
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsStore:
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last_flush = 0.0
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'artbackend-metrics')
+
+    def add(self, key, amount):
+        with self.lock:
+            self.samples[key] = add(self.samples.get(key), amount)
+
+    def snapshot(self):
+        with self.lock:
+            return [[name, list(labels), value] for (name, labels), value in self.samples.items()]
+
+    def flush(self, force=False):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if not force and time.monotonic() - self.last_flush < interval:
+            return
+        # Another thread already writing this process's file is good enough.
+        if not self.flush_lock.acquire(blocking=force):
+            return
+        try:
+            self.last_flush = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            # Write then rename, so readers never see a half-written file.
+            temporary = f'{path}.tmp'
+            with open(temporary, 'w') as output:
+                json.dump({'pid': os.getpid(), 'samples': self.snapshot()}, output)
+            os.replace(temporary, path)
+        finally:
+            self.flush_lock.release()
+
+    def prune(self):
+        """Removes the files of processes that have exited."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            pid = name.split('.')[0]
+            if not pid.isdigit():
+                continue
+            if int(pid) == os.getpid():
+                # Left by an earlier process with the same pid, unless this
+                # one has written it already.
+                stale = not self.last_flush
+            else:
+                stale = not pid_alive(int(pid))
+            if not stale:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def read_processes(self):
+        yield os.getpid(), self.snapshot()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith('.json') or name == f'{os.getpid()}.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as data_file:
+                    data = json.load(data_file)
+            except (OSError, ValueError):
+                continue
+            yield data['pid'], data['samples']
+
+    def collect(self):
+        gauges = {metric.name for metric in registry if metric.kind == 'gauge'}
+        totals = {}
+        for pid, samples in self.read_processes():
+            alive = None
+            for name, labels, value in samples:
+                if name in gauges:
+                    if alive is None:
+                        alive = pid_alive(pid)
+                    if not alive:
+                        continue
+                key = (name, tuple(labels))
+                totals[key] = add(totals.get(key), value)
+        return totals
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    totals = store.collect()
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        samples = sorted((labels, value) for (name, labels), value in totals.items() if name == metric.name)
+        for labels, value in samples:
+            if metric.kind != 'histogram':
+                lines.append(f'{metric.name}{format_labels(metric.labelnames, labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), value):
+                cumulative += count
+                le = ('le', bound if bound == '+Inf' else repr(float(bound)))
+                lines.append(f'{metric.name}_bucket{format_labels(metric.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{metric.name}_sum{format_labels(metric.labelnames, labels)} {value[-2]}')
+            lines.append(f'{metric.name}_count{format_labels(metric.labelnames, labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = []
+store = MetricsStore()
+atexit.register(lambda: store.samples and store.flush(force=True))
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name.', ('view', 'method', 'status'),
+)
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being served.')
+DB_QUERIES = Counter('db_queries_total', 'Database queries by URL name.', ('view',))
+CHECKOUTS = Counter('checkout_total', 'Checkout attempts by outcome.', ('outcome',))
+
+
+# Query counting, per request, across sync and async code.
+_query_counter = ContextVar('metrics_query_counter', default=None)
+_install_lock = threading.Lock()
+_installed = False
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def add_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def install():
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        connection_created.connect(add_query_counter, dispatch_uid='core.metrics')
+        for connection in connections.all(initialized_only=True):
+            add_query_counter(None, connection)
+        store.prune()
+        _installed = True
+
+
+def start_request():
+    REQUESTS_IN_FLIGHT.inc()
+    counter = [0]
+    return counter, _query_counter.set(counter), time.perf_counter()
+
+
+def finish_request(request, status, state):
+    counter, token, started = state
+    _query_counter.reset(token)
+    match = getattr(request, 'resolver_match', None)
+    view = (match.view_name if match else None) or 'unmatched'
+    REQUEST_LATENCY.observe(time.perf_counter() - started, view=view, method=request.method, status=status)
+    DB_QUERIES.inc(counter[0], view=view)
+    REQUESTS_IN_FLIGHT.dec()
+    store.flush()
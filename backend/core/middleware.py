@@ -0,0 +1,264 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from . import instrumentation, metrics
+from .authentication import aauthenticate, authenticate_token
+from .routers import replica_aliases, replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+instrumentation_logger = logging.getLogger('core.instrumentation')
+
+
+class MetricsMiddleware:
+    """
+    Records request latency, in-flight requests and query counts per URL
+    name for the /metrics/ endpoint. Listed first in MIDDLEWARE so the
+    latency covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        metrics.install()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = metrics.start_request()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+        finally:
+            metrics.finish_request(request, status, state)
+        return response
+
+    async def __acall__(self, request):
+        state = metrics.start_request()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+        finally:
+            metrics.finish_request(request, status, state)
+        return response
+
+
+class OAuth2TokenMiddleware:
+    """
+    Drop-in for oauth2_provider.middleware.OAuth2TokenMiddleware that also
+    runs natively under ASGI.
+
+    The upstream middleware is sync-only, which forces Django to run every
+    request, async views included, through a worker thread. Both paths
+    validate the token through the cache in core.authentication.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.should_authenticate(request):
+            result = authenticate_token(request)
+            # CachedOAuth2Authentication picks this up instead of resolving
+            # the token a second time.
+            request._bearer_authentication = result
+            if result:
+                request.user = request._cached_user = result[0]
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    async def __acall__(self, request):
+        if await self.ashould_authenticate(request):
+            user = await aauthenticate(request)
+            if user:
+                request.user = request._cached_user = request._acached_user = user
+        response = await self.get_response(request)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def has_bearer_token(self, request):
+        return request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer')
+
+    def should_authenticate(self, request):
+        if not self.has_bearer_token(request):
+            return False
+        return not hasattr(request, 'user') or request.user.is_anonymous
+
+    async def ashould_authenticate(self, request):
+        # request.user would load the session synchronously, which is not
+        # allowed in the event loop.
+        if not self.has_bearer_token(request):
+            return False
+        if not hasattr(request, 'auser'):
+            return True
+        return (await request.auser()).is_anonymous
+
+
+class ReadReplicaMiddleware:
+    """
+    Lets GET and HEAD requests read from the database replicas.
+
+    A user who wrote within the last READ_YOUR_WRITES_SECONDS keeps reading
+    from the primary, so replication lag never hides their own changes. The
+    pin lives in READ_YOUR_WRITES_CACHE, which every worker must share
+    (memcached, Redis, or the database cache after `createcachetable`).
+    """
+    sync_capable = True
+    async_capable = True
+
+    # Caches that live inside one process: a pin set by the worker that
+    # handled the write would not be seen by the others.
+    PROCESS_LOCAL_CACHES = {
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    }
+
+    def __init__(self, get_response):
+        if replica_aliases() and self.cache_backend in self.PROCESS_LOCAL_CACHES:
+            raise ImproperlyConfigured(
+                'DATABASE_REPLICAS needs READ_YOUR_WRITES_CACHE to name a cache shared by every worker '
+                f'(got {self.cache_backend}).'
+            )
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method in SAFE_METHODS and not self.is_pinned(request.user):
+            with replica_reads():
+                return self.get_response(request)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and request.user.is_authenticated:
+            self.cache.set(self.pin_key(request.user), True, self.pin_seconds)
+        return response
+
+    async def __acall__(self, request):
+        user = getattr(request, '_cached_user', None) or await request.auser()
+        if request.method in SAFE_METHODS and not await self.ais_pinned(user):
+            with replica_reads():
+                return await self.get_response(request)
+        response = await self.get_response(request)
+        user = getattr(request, '_cached_user', None) or user
+        if request.method not in SAFE_METHODS and user.is_authenticated:
+            await self.cache.aset(self.pin_key(user), True, self.pin_seconds)
+        return response
+
+    @property
+    def cache_alias(self):
+        return getattr(settings, 'READ_YOUR_WRITES_CACHE', 'default')
+
+    @property
+    def cache_backend(self):
+        return settings.CACHES[self.cache_alias]['BACKEND']
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def pin_seconds(self):
+        return getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+
+    def pin_key(self, user):
+        return f'db-primary-pin:{user.pk}'
+
+    def is_pinned(self, user):
+        return user.is_authenticated and self.cache.get(self.pin_key(user)) is not None
+
+    async def ais_pinned(self, user):
+        return user.is_authenticated and await self.cache.aget(self.pin_key(user)) is not None
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Opt-in per-request measurements: query count, SQL, serializer and view
+    time, reported as a Server-Timing header and a JSON log line.
+
+    Listed last in MIDDLEWARE so it measures the view rather than the other
+    middleware. Queries repeated REQUEST_INSTRUMENTATION_DUPLICATE_THRESHOLD
+    times are logged as likely N+1s, and requests over their QUERY_BUDGETS
+    entry are logged, or raise QueryBudgetExceeded when
+    QUERY_BUDGETS_ENFORCED is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        instrumentation.install()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = instrumentation.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.view_time = time.perf_counter() - started
+            instrumentation.finish(token)
+        self.report(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = instrumentation.start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.view_time = time.perf_counter() - started
+            instrumentation.finish(token)
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics):
+        response.headers['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        instrumentation_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }, sort_keys=True))
+
+        threshold = getattr(settings, 'REQUEST_INSTRUMENTATION_DUPLICATE_THRESHOLD', 5)
+        for sql, count in metrics.duplicates(threshold):
+            instrumentation_logger.warning(
+                'Query ran %d times in %s %s: %s', count, request.method, request.path, sql[:300],
+            )
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and metrics.query_count > budget:
+            message = f'{view_name} ran {metrics.query_count} queries, over its budget of {budget}.'
+            if getattr(settings, 'QUERY_BUDGETS_ENFORCED', False):
+                raise instrumentation.QueryBudgetExceeded(message)
+            instrumentation_logger.warning(message)
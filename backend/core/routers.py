@@ -0,0 +1,88 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Every database alias besides the primary is a replica; settings builds them
+# from DATABASE_REPLICAS, a comma-separated list of SQLite copies of the
+# primary. Reads go to a random replica that is not marked down.
+#
+# Reads only leave the primary inside replica_reads(), which
+# ReadReplicaMiddleware enters for GET/HEAD requests. Management commands,
+# jobs and writes always see the primary.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# Apps whose rows must be visible the moment they are written.
+PRIMARY_ONLY_APPS = {'oauth2_provider', 'sessions'}
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_aliases():
+    return [alias for alias in connections.settings if alias != DEFAULT_DB_ALIAS]
+
+
+class ReplicaHealth:
+    """Remembers replicas that failed to connect and skips them for a while."""
+
+    def __init__(self):
+        self.down_until = {}
+        self.lock = threading.Lock()
+
+    def is_available(self, alias):
+        if self.down_until.get(alias, 0) > time.monotonic():
+            return False
+        connection = connections[alias]
+        if connection.connection is not None:
+            return True
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            retry = getattr(settings, 'DATABASE_REPLICA_RETRY_SECONDS', 30)
+            logger.warning('Read replica %s is unavailable, using the primary for %ss.', alias, retry)
+            with self.lock:
+                self.down_until[alias] = time.monotonic() + retry
+            connection.close()
+            return False
+        return True
+
+
+replica_health = ReplicaHealth()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = replica_aliases()
+        random.shuffle(replicas)
+        for alias in replicas:
+            if replica_health.is_available(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import get_access_token_model
+
+from .authentication import token_cache
+
+
+@receiver(post_save, sender=get_access_token_model())
+@receiver(post_delete, sender=get_access_token_model())
+def invalidate_access_token(sender, instance, **kwargs):
+    # Revocation deletes the token; refreshing or editing it saves it.
+    token_cache.invalidate(instance.token_checksum)
+
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+
+def create_access_token(user, token, scope='read write', expires_in=timedelta(hours=1)):
+    """A bearer token for ``user`` that tests send as ``Authorization: Bearer <token>``."""
+    return AccessToken.objects.create(user=user, token=token, scope=scope, expires=timezone.now() + expires_in)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Buffered activity would outlive the test that recorded it in the
+        # process-wide recorder; tests of the buffer opt back in.
+        settings.ACTIVITY_BUFFERING = False
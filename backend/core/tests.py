@@ -0,0 +1,451 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application, RefreshToken
+from rest_framework.serializers import BaseSerializer
+
+from artist.models import CustomUser, Follow, Post
+from ecommerce.models import Cart, CartItem, Order
+
+from . import instrumentation, jobs, metrics, routers
+from .middleware import ReadReplicaMiddleware
+from .models import IdempotencyKey, Job
+from .testing import create_access_token
+
+leases_seen = []
+
+
+def failing_task():
+    raise ValueError('boom')
+
+
+def slow_task(seconds):
+    time.sleep(seconds)
+    leases_seen.append(Job.objects.get(status='running').locked_until)
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = CustomUser.objects.create_user(username='buyer', password='x')
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.post = Post.objects.create(user=cls.artist, title='Dunes', price=100)
+        create_access_token(cls.buyer, 'buyer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer buyer-token'
+
+    def follow(self, key=None, username='artist'):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post('/api/follows/toggle/', {'username': username},
+                                content_type='application/json', headers=headers)
+
+    def checkout(self, key):
+        return self.client.post('/ecommerce/checkout/', headers={'Idempotency-Key': key})
+
+    def fill_cart(self):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartItem.objects.create(cart=cart, post=self.post)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.follow('follow-1')
+        retry = self.follow('follow-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        # The toggle ran once, so the user is still following.
+        self.assertTrue(Follow.objects.filter(follower=self.buyer, following=self.artist).exists())
+
+    def test_requests_without_a_key_are_not_stored(self):
+        self.assertEqual(self.follow().status_code, 201)
+        self.assertEqual(self.follow().status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_key_reused_for_a_different_request(self):
+        CustomUser.objects.create_user(username='other', password='x')
+        self.follow('follow-1')
+        response = self.follow('follow-1', username='other')
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Follow.objects.filter(following__username='other').exists())
+
+    def test_request_in_flight(self):
+        IdempotencyKey.objects.create(user=self.buyer, key='follow-1', fingerprint='running')
+        self.assertEqual(self.follow('follow-1').status_code, 409)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_abandoned_request_frees_the_key_after_its_lease(self):
+        IdempotencyKey.objects.create(
+            user=self.buyer, key='follow-1', fingerprint='running',
+            created_at=timezone.now() - timedelta(minutes=5),
+        )
+        with override_settings(IDEMPOTENCY_KEY_LEASE=60):
+            self.assertEqual(self.follow('follow-1').status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key='follow-1').status_code, 201)
+
+    def test_expired_key_runs_again(self):
+        self.follow('follow-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        with override_settings(IDEMPOTENCY_KEY_TTL=24 * 60 * 60):
+            response = self.follow('follow-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_transient_error_releases_the_key(self):
+        self.fill_cart()
+        locked = OperationalError('database is locked')
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=locked):
+            with self.assertRaises(OperationalError):
+                self.checkout('checkout-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.checkout('checkout-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.is_sold)
+
+    def test_deliberate_client_error_is_replayed(self):
+        Cart.objects.create(user=self.buyer)
+        self.assertEqual(self.checkout('checkout-1').status_code, 400)
+        self.fill_cart()
+        retry = self.checkout('checkout-1')
+        self.assertEqual(retry.status_code, 400)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(Order.objects.exists())
+
+    def test_purge_removes_expired_and_abandoned_keys(self):
+        now = timezone.now()
+        IdempotencyKey.objects.create(user=self.buyer, key='done', fingerprint='x', status_code=201)
+        IdempotencyKey.objects.create(user=self.buyer, key='running', fingerprint='x')
+        IdempotencyKey.objects.create(user=self.buyer, key='expired', fingerprint='x', status_code=201,
+                                      created_at=now - timedelta(days=2))
+        IdempotencyKey.objects.create(user=self.buyer, key='abandoned', fingerprint='x',
+                                      created_at=now - timedelta(minutes=5))
+        call_command('purge_idempotency_keys', batch_size=1, stdout=StringIO())
+        self.assertCountEqual(IdempotencyKey.objects.values_list('key', flat=True), ['done', 'running'])
+
+
+class LoginTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='viewer', password='secret-pass')
+        cls.application = Application.objects.create(
+            name='web', client_id=settings.CLIENT_ID, client_secret=settings.CLIENT_SECRET,
+            client_type=Application.CLIENT_CONFIDENTIAL, authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+
+    def login(self):
+        return self.client.post('/api/login/', {'username': 'viewer', 'password': 'secret-pass'},
+                                content_type='application/json')
+
+    def me(self, access_token):
+        return self.client.get('/api/me/', headers={'Authorization': f'Bearer {access_token}'})
+
+    def test_each_login_gets_its_own_tokens(self):
+        phone, laptop = self.login().json(), self.login().json()
+        self.assertEqual(phone['scope'], 'read write')
+        self.assertNotEqual(phone['access_token'], laptop['access_token'])
+        self.assertNotEqual(phone['refresh_token'], laptop['refresh_token'])
+
+    def test_logout_ends_only_its_own_session(self):
+        phone, laptop = self.login().json(), self.login().json()
+        response = self.client.post('/api/logout/', headers={'Authorization': f'Bearer {phone["access_token"]}'})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me(phone['access_token']).status_code, 401)
+        self.assertEqual(self.me(laptop['access_token']).status_code, 200)
+        self.assertIsNotNone(RefreshToken.objects.get(token=phone['refresh_token']).revoked)
+        self.assertIsNone(RefreshToken.objects.get(token=laptop['refresh_token']).revoked)
+
+    def test_wrong_password(self):
+        response = self.client.post('/api/login/', {'username': 'viewer', 'password': 'nope'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_missing_application_is_a_failed_login(self):
+        self.application.delete()
+        self.assertEqual(self.login().status_code, 401)
+
+    def test_purge_removes_expired_and_revoked_tokens(self):
+        live = create_access_token(self.user, 'live')
+        expired = create_access_token(self.user, 'expired', expires_in=-timedelta(seconds=1))
+        revoked = create_access_token(self.user, 'revoked')
+        RefreshToken.objects.create(user=self.user, application=self.application, token='live-refresh',
+                                    access_token=live)
+        RefreshToken.objects.create(user=self.user, application=self.application, token='revoked-refresh',
+                                    access_token=revoked, revoked=timezone.now())
+        call_command('purge_tokens', batch_size=1, stdout=StringIO())
+        self.assertCountEqual(AccessToken.objects.values_list('token', flat=True), ['live', 'revoked'])
+        self.assertCountEqual(RefreshToken.objects.values_list('token', flat=True), ['live-refresh'])
+        self.assertFalse(AccessToken.objects.filter(pk=expired.pk).exists())
+
+
+@override_settings(JOB_QUEUE_EAGER=False, JOB_QUEUE_RETRY_DELAY=10)
+class JobQueueTests(TestCase):
+    def test_claimed_jobs_are_not_claimed_again(self):
+        job = jobs.enqueue(failing_task)
+        self.assertEqual(jobs.claim_jobs(10, 60), [job])
+        self.assertEqual(jobs.claim_jobs(10, 60), [])
+
+    def test_claim_lost_to_another_worker(self):
+        job = jobs.enqueue(failing_task)
+        calls = []
+
+        def racing_claimable(now):
+            # The UPDATE re-checks the claim; let another worker win the
+            # row between the SELECT and it.
+            calls.append(now)
+            if len(calls) == 2:
+                Job.objects.filter(pk=job.pk).update(
+                    status='running', locked_by='other-worker', locked_until=now + timedelta(minutes=1),
+                )
+            return claimable(now)
+
+        claimable = jobs.claimable
+        with mock.patch('core.jobs.claimable', side_effect=racing_claimable):
+            self.assertEqual(jobs.claim_jobs(10, 60), [])
+        job.refresh_from_db()
+        self.assertEqual((job.locked_by, job.attempts), ('other-worker', 0))
+
+    def test_failures_are_retried_with_backoff(self):
+        job = jobs.enqueue(failing_task)
+        for attempt, delay in ((1, 10), (2, 20)):
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            claimed, = jobs.claim_jobs(10, 60)
+            with self.assertLogs('core.jobs', 'WARNING'):
+                started = timezone.now()
+                self.assertFalse(jobs.run_job(claimed, 60))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', attempt))
+            self.assertAlmostEqual((job.run_at - started).total_seconds(), delay, delta=1)
+            self.assertIn('ValueError: boom', job.last_error)
+
+    def test_last_failed_attempt_fails_the_job(self):
+        job = jobs.enqueue(failing_task, max_attempts=1)
+        claimed, = jobs.claim_jobs(10, 60)
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_job(claimed, 60)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(jobs.claim_jobs(10, 60), [])
+
+    def test_expired_lease_is_reclaimed_while_attempts_remain(self):
+        job = jobs.enqueue(failing_task, max_attempts=2)
+        jobs.claim_jobs(10, 60)
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed, = jobs.claim_jobs(10, 60)
+        self.assertEqual(reclaimed.attempts, 2)
+
+    def test_job_that_keeps_killing_its_worker_fails(self):
+        job = jobs.enqueue(failing_task, max_attempts=1)
+        jobs.claim_jobs(10, 60)
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(jobs.claim_jobs(10, 60), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_until), ('failed', None))
+
+
+@override_settings(JOB_QUEUE_EAGER=False)
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread, so the job row has to be
+    # committed for it to see.
+
+    def test_lease_is_extended_while_the_job_runs(self):
+        jobs.enqueue(slow_task, seconds=0.5)
+        claimed, = jobs.claim_jobs(10, 0.3)
+        leases_seen.clear()
+        self.assertTrue(jobs.run_job(claimed, 0.3))
+        self.assertGreater(leases_seen[0], claimed.locked_until)
+
+
+@mock.patch('core.middleware.replica_aliases', return_value=['replica1'])
+class ReadReplicaMiddlewareTests(TestCase):
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_replicas_need_a_shared_cache(self, replica_aliases):
+        with self.assertRaises(ImproperlyConfigured):
+            ReadReplicaMiddleware(lambda request: None)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                           'LOCATION': '/tmp/read-your-writes'}})
+    def test_shared_cache_is_accepted(self, replica_aliases):
+        ReadReplicaMiddleware(lambda request: None)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                       'LOCATION': os.path.join(tempfile.gettempdir(), 'read-your-writes-tests')}})
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Two SQLite replica files, each holding a post titled after itself, next
+    to the primary's post titled "primary". Runs outside a transaction:
+    reads inside one always stay on the primary.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='viewer', password='x')
+        Post.objects.create(user=self.user, title='primary')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for alias in ('replica1', 'replica2'):
+            self.add_replica(alias, self.copy_posts(alias))
+        # The replicas only exist for the test, so they can't be listed in
+        # the class's databases up front.
+        patcher = mock.patch.object(type(self), 'databases', {DEFAULT_DB_ALIAS, 'replica1', 'replica2'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routers.replica_health.down_until.clear()
+        self.addCleanup(routers.replica_health.down_until.clear)
+        caches['default'].clear()
+
+    def copy_posts(self, title):
+        path = os.path.join(self.directory, f'{title}.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'artist_post'")
+            schema, = cursor.fetchone()
+            cursor.execute('SELECT * FROM artist_post')
+            columns = [column[0] for column in cursor.description]
+            row = dict(zip(columns, cursor.fetchone()), title=title)
+        replica = sqlite3.connect(path)
+        with replica:
+            replica.execute(schema)
+            replica.execute(
+                f'INSERT INTO artist_post ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                [row[column] for column in columns],
+            )
+        replica.close()
+        return path
+
+    def add_replica(self, alias, path):
+        databases = {
+            DEFAULT_DB_ALIAS: dict(connections.settings[DEFAULT_DB_ALIAS]),
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'file:{path}?mode=ro'},
+        }
+        connections.settings[alias] = connections.configure_settings(databases)[alias]
+
+        def remove():
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+        self.addCleanup(remove)
+
+    def titles(self, reads=30):
+        with routers.replica_reads():
+            return {title for _ in range(reads) for title in Post.objects.values_list('title', flat=True)}
+
+    def test_reads_are_spread_over_the_replicas(self):
+        self.assertEqual(self.titles(), {'replica1', 'replica2'})
+        self.assertEqual(set(Post.objects.values_list('title', flat=True)), {'primary'})
+        with transaction.atomic():
+            self.assertEqual(self.titles(reads=5), {'primary'})
+
+    def test_writes_go_to_the_primary(self):
+        with routers.replica_reads():
+            Post.objects.create(user=self.user, title='new')
+        self.assertEqual(set(Post.objects.values_list('title', flat=True)), {'primary', 'new'})
+        self.assertEqual(self.titles(), {'replica1', 'replica2'})
+
+    def test_missing_replica_fails_over(self):
+        os.remove(os.path.join(self.directory, 'replica2.sqlite3'))
+        with self.assertLogs('core.routers', 'WARNING'):
+            self.assertEqual(self.titles(), {'replica1'})
+        os.remove(os.path.join(self.directory, 'replica1.sqlite3'))
+        connections['replica1'].close()
+        with self.assertLogs('core.routers', 'WARNING'):
+            self.assertEqual(self.titles(), {'primary'})
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        def read_titles(request):
+            return set(Post.objects.values_list('title', flat=True))
+
+        middleware = ReadReplicaMiddleware(read_titles)
+        factory = RequestFactory()
+
+        def send(method, user):
+            request = getattr(factory, method)('/')
+            request.user = user
+            return middleware(request)
+
+        other = CustomUser.objects.create_user(username='other', password='x')
+        self.assertNotIn('primary', send('get', self.user))
+        send('post', self.user)
+        self.assertEqual(send('get', self.user), {'primary'})
+        self.assertNotIn('primary', send('get', other))
+        self.assertNotIn('primary', send('get', AnonymousUser()))
+        with override_settings(READ_YOUR_WRITES_SECONDS=0.01):
+            send('post', other)
+        time.sleep(0.05)
+        self.assertNotIn('primary', send('get', other))
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', password='x')
+        create_access_token(cls.viewer, 'viewer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer viewer-token'
+        self.data = BaseSerializer.data
+
+    def test_serializers_are_only_wrapped_while_enabled(self):
+        self.client.get('/api/me/')
+        self.assertIs(BaseSerializer.data, self.data)
+        with self.settings(REQUEST_INSTRUMENTATION=True), self.assertLogs('core.instrumentation', 'INFO') as logs:
+            # A new client, since middleware is loaded on a client's first request.
+            self.client_class().get('/api/me/', headers={'Authorization': 'Bearer viewer-token'})
+            self.assertIsNot(BaseSerializer.data, self.data)
+            self.assertIn(instrumentation.record_queries, connection.execute_wrappers)
+        self.assertGreater(json.loads(logs.records[0].getMessage())['serializer_ms'], 0)
+        self.assertIs(BaseSerializer.data, self.data)
+        self.assertNotIn(instrumentation.record_queries, connection.execute_wrappers)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(METRICS_DIR=self.directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def write_process(self, pid):
+        with open(os.path.join(self.directory, f'{pid}.json'), 'w') as output:
+            json.dump({'pid': pid, 'samples': [['checkout_total', ['success'], 1]]}, output)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        response = self.client.get('/metrics/', headers={'Authorization': 'Bearer scraper-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE checkout_total counter', response.content.decode())
+
+    def test_files_of_exited_processes_are_pruned(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        self.write_process(exited.pid)
+        self.write_process(os.getppid())
+        metrics.store.prune()
+        self.assertEqual(os.listdir(self.directory), [f'{os.getppid()}.json'])
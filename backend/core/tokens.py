@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from oauthlib.common import generate_token
+from oauth2_provider.models import get_access_token_model, get_application_model, get_refresh_token_model
+from oauth2_provider.settings import oauth2_settings
+
+# Issues password-grant tokens for the first-party client directly, instead
+# of running a request through TokenView. The client is identified by
+# settings.CLIENT_ID; its secret never leaves the server, so it is not
+# re-checked here. Expired tokens are removed with `manage.py purge_tokens`.
+
+
+def get_login_application():
+    return get_application_model().objects.get(client_id=settings.CLIENT_ID)
+
+
+def token_response(access_token, refresh_token):
+    """The same payload TokenView returns for a password grant."""
+    data = {
+        'access_token': access_token.token,
+        'expires_in': max(0, int((access_token.expires - timezone.now()).total_seconds())),
+        'token_type': 'Bearer',
+        'scope': access_token.scope,
+    }
+    if refresh_token is not None:
+        data['refresh_token'] = refresh_token.token
+    return data
+
+
+def get_login_scope():
+    scopes = oauth2_settings.DEFAULT_SCOPES
+    if '__all__' in scopes:
+        scopes = oauth2_settings.SCOPES
+    return ' '.join(scopes)
+
+
+def issue_token(user, application=None):
+    """
+    Return a new (access_token, refresh_token) pair for ``user``.
+
+    Every login gets its own pair, so logging out or rotating the refresh
+    token on one device leaves the user's other sessions alone.
+    """
+    application = application or get_login_application()
+    scope = get_login_scope()
+
+    with transaction.atomic():
+        access_token = get_access_token_model().objects.create(
+            user=user,
+            application=application,
+            scope=scope,
+            token=generate_token(),
+            expires=timezone.now() + timedelta(seconds=oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS),
+        )
+        refresh_token = get_refresh_token_model().objects.create(
+            user=user,
+            application=application,
+            access_token=access_token,
+            token=generate_token(),
+        )
+    return access_token, refresh_token
@@ -0,0 +1,19 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics as metrics_module
+
+
+def metrics(request):
+    # Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>".
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        # Without a token the endpoint is only open in development.
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_module.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
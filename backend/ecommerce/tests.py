@@ -1,3 +1,71 @@
+from unittest import mock
+
+from django.db.models.query import QuerySet
 from django.test import TestCase
 
-# Create your tests here.
+from artist.models import CustomUser, Post
+from core.testing import create_access_token
+
+from .models import Cart, CartItem, Order, OrderItem
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = CustomUser.objects.create_user(username='buyer', password='x')
+        cls.artist = CustomUser.objects.create_user(username='artist', password='x')
+        cls.dunes = Post.objects.create(user=cls.artist, title='Dunes', price=100)
+        cls.harbour = Post.objects.create(user=cls.artist, title='Harbour', price=250)
+        cls.cart = Cart.objects.create(user=cls.buyer)
+        CartItem.objects.create(cart=cls.cart, post=cls.dunes)
+        CartItem.objects.create(cart=cls.cart, post=cls.harbour)
+        create_access_token(cls.buyer, 'buyer-token')
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer buyer-token'
+
+    def checkout(self):
+        return self.client.post('/ecommerce/checkout/')
+
+    def assertNothingOrdered(self):
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_checkout_places_the_order(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.buyer)
+        self.assertEqual(response.json()['order']['id'], order.pk)
+        self.assertEqual(order.total_amount, 350)
+        self.assertCountEqual(order.items.values_list('post_id', 'price'), [(self.dunes.pk, 100), (self.harbour.pk, 250)])
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(Post.objects.filter(is_sold=True).count(), 2)
+
+    def test_post_already_sold(self):
+        Post.objects.filter(pk=self.harbour.pk).update(is_sold=True)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['sold_items'], ['Harbour'])
+        self.assertNothingOrdered()
+
+    def test_post_sold_by_a_concurrent_checkout(self):
+        update = QuerySet.update
+        competing = []
+
+        def sell_harbour_first(queryset, **kwargs):
+            # Another buyer's checkout commits between reading the cart and
+            # marking its posts sold.
+            if queryset.model is Post and not competing:
+                competing.append(update(Post.objects.filter(pk=self.harbour.pk), is_sold=True))
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', sell_harbour_first):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('have been sold', response.json()['error'])
+        self.assertEqual(competing, [1])
+        self.assertNothingOrdered()
+        # Marking the rest of the cart sold was rolled back.
+        self.dunes.refresh_from_db()
+        self.assertFalse(self.dunes.is_sold)
@@ -4,12 +4,16 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Cart, CartItem, Order, OrderItem, Address
 from artist.models import Post
 from .serializers import *
-from django.db import transaction
+from django.db import DatabaseError, transaction
+from django.db.models import prefetch_related_objects
+from core.idempotency import idempotent
+from core.metrics import CHECKOUTS
 
 class AddToCartView(generics.CreateAPIView):
     serializer_class = AddCartItemSerializer
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         post_id = request.data.get('post')
         try:
@@ -42,6 +46,10 @@ class AddToCartView(generics.CreateAPIView):
                 {"error": "Artwork not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except DatabaseError:
+            # Transient (e.g. a locked database): a 500 tells the client to
+            # retry rather than that the request itself was bad.
+            raise
         except Exception as e:
             return Response(
                 {"error": str(e)},
@@ -73,67 +81,62 @@ class RemoveFromCartView(generics.DestroyAPIView):
 class CheckoutView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         try:
-            cart = Cart.objects.get(user=request.user)
-            items = cart.items.select_related('post')
-
-            if not items:
-                return Response({'error': 'Cart is empty'}, status=400)
-
-            # Check if any items in the cart are already sold
-            sold_items = []
-            for item in items:
-                if item.post.is_sold:
-                    sold_items.append(item.post.title)
-
-            if sold_items:
-                return Response({
-                    'error': f"The following items have already been sold: {', '.join(sold_items)}",
-                    'sold_items': sold_items
-                }, status=400)
-
-            # Calculate total and create order
-            total = sum([item.get_total_price() for item in items])
-            
-            # Use transaction to ensure database consistency
+            # Everything from reading the cart to clearing it is one short
+            # transaction; the posts are locked from the sold-marking UPDATE
+            # on, and the statements after it don't depend on cart size.
             with transaction.atomic():
-                # Lock the posts for update to prevent race conditions
-                post_ids = [item.post.id for item in items]
-                posts = Post.objects.select_for_update().filter(id__in=post_ids)
-                
-                # Double check if any posts are sold
-                if any(post.is_sold for post in posts):
+                cart = Cart.objects.get(user=request.user)
+                items = list(cart.items.select_related('post'))
+
+                if not items:
+                    CHECKOUTS.inc(outcome='empty_cart')
+                    return Response({'error': 'Cart is empty'}, status=400)
+
+                sold_items = [item.post.title for item in items if item.post.is_sold]
+                if sold_items:
+                    CHECKOUTS.inc(outcome='sold_out')
+                    return Response({
+                        'error': f"The following items have already been sold: {', '.join(sold_items)}",
+                        'sold_items': sold_items
+                    }, status=400)
+
+                # Only rows still unsold are updated, so a concurrent checkout
+                # that got there first shows up as a short row count.
+                post_ids = {item.post_id for item in items}
+                if Post.objects.filter(pk__in=post_ids, is_sold=False).update(is_sold=True) != len(post_ids):
+                    transaction.set_rollback(True)
+                    CHECKOUTS.inc(outcome='conflict')
                     return Response({
                         'error': 'Some items in your cart have been sold. Please refresh your cart.'
                     }, status=400)
 
-                # Create order
+                total = sum(item.get_total_price() for item in items)
                 order = Order.objects.create(user=request.user, total_amount=total)
-
-                # Create order items and mark posts as sold
-                for item in items:
-                    OrderItem.objects.create(
-                        order=order,
-                        post=item.post,
-                        price=item.post.price,
-                        quantity=item.quantity
-                    )
-                    item.post.is_sold = True
-                    item.post.save()
-
-                # Clear the cart
-                cart.items.all().delete()
-
-                serializer = OrderSerializer(order)
-                return Response({
-                    'message': 'Order placed successfully',
-                    'order': serializer.data
-                }, status=201)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, post=item.post, price=item.post.price, quantity=item.quantity)
+                    for item in items
+                ])
+                cart.items.filter(pk__in=[item.pk for item in items]).delete()
+
+            prefetch_related_objects([order], 'items__post')
+            serializer = OrderSerializer(order)
+            CHECKOUTS.inc(outcome='success')
+            return Response({
+                'message': 'Order placed successfully',
+                'order': serializer.data
+            }, status=201)
 
         except Cart.DoesNotExist:
+            CHECKOUTS.inc(outcome='no_cart')
             return Response({'error': 'Cart not found'}, status=404)
+        except DatabaseError:
+            CHECKOUTS.inc(outcome='error')
+            raise
         except Exception as e:
+            CHECKOUTS.inc(outcome='error')
             return Response({'error': str(e)}, status=400)
 
 # List Orders
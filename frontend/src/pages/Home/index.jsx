@@ -80,7 +80,7 @@ const Home = () => {
       });
       
       // Only update posts if there are actual changes
-      const newPosts = response.data;
+      const newPosts = response.data.results;
       setPosts(prevPosts => {
         // Check if the posts have actually changed
         if (JSON.stringify(prevPosts) !== JSON.stringify(newPosts)) {
@@ -117,7 +117,7 @@ const Profile = () => {
         `${API_URL}/users/${username || 'me'}/posts/`,
         { headers }
       );
-      setUserPosts(postsResponse.data);
+      setUserPosts(postsResponse.data.results);
 
       // Only fetch saved posts and activities for own profile
       if (isOwnProfile) {
@@ -131,7 +131,7 @@ const Profile = () => {
           `${API_URL}/user-activity/`,
           { headers }
         );
-        setActivities(activitiesResponse.data);
+        setActivities(activitiesResponse.data.results);
       }
 
       // Check if following this user
@@ -170,7 +170,7 @@ const Profile = () => {
           },
         }
       );
-      setFollowers(response.data);
+      setFollowers(response.data.results);
       setFollowersDialogOpen(true);
     } catch (error) {
       console.error('Error fetching followers:', error);
@@ -190,7 +190,7 @@ const Profile = () => {
           },
         }
       );
-      setFollowing(response.data);
+      setFollowing(response.data.results);
       setFollowingDialogOpen(true);
     } catch (error) {
       console.error('Error fetching following:', error);
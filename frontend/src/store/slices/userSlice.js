@@ -85,7 +85,7 @@ export const fetchUserPosts = createAsyncThunk(
   async (_, { rejectWithValue }) => {
     try {
       const response = await axios.get(`${API_URL}/posts/`, getAxiosConfig());
-      return response.data;
+      return response.data.results;
     } catch (error) {
       if (error.response?.status === 401) {
         toast.error('Session expired. Please login again.');